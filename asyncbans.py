@@ -0,0 +1,132 @@
+import asyncio
+import collections
+
+from main import AVLTree
+
+
+# asyncio front end over a built AVLTree or ScapeGoatTree, for callers like a login
+# gateway that cannot block on a lookup:
+#
+#   checker = AsyncBanChecker(tree, root)
+#   if await checker.isBanned(user): ...
+#   await checker.addBan(user, serverBannedOn, timeOfBan)
+
+
+class AsyncBanChecker:
+    def __init__(self, tree, root=None, batchWindow=0.0005, insertSlice=1000):
+        """
+        Checks are not looked up one at a time. Checks arriving within batchWindow are
+        gathered and answered with one getPlayers walk, and checks for a user already
+        waiting share that user's answer. Bans are queued and put in the tree between
+        batches, at most insertSlice at a time, so a burst of bans never holds up checks
+        :param tree: AVLTree or ScapeGoatTree to answer from
+        :param root: root of the tree for an AVLTree, a ScapeGoatTree keeps its own
+        :param batchWindow: seconds to gather checks before answering them
+        :param insertSlice: most bans to insert before answering the waiting checks
+        """
+        self.tree = tree
+        self.root = root
+        self.batchWindow = batchWindow
+        self.insertSlice = insertSlice
+        # one future per user waiting on the next batch, shared by all their checks
+        self.pendingChecks = dict()
+        # bans waiting to go in the tree, with the future to resolve once they are in
+        self.pendingBans = collections.deque()
+        self.flushHandle = None
+
+        # counters for tuning the window
+        self.checks = 0
+        self.coalescedChecks = 0
+        self.batches = 0
+
+    def currentRoot(self):
+        if (isinstance(self.tree, AVLTree)):
+            return self.root
+        return self.tree.root
+
+    def scheduleFlush(self):
+        if (self.flushHandle is None):
+            loop = asyncio.get_running_loop()
+            self.flushHandle = loop.call_later(self.batchWindow, self.flush)
+
+    async def getBan(self, user):
+        """
+        :param user: name of the user to check
+        :return: their number of bans and most recent time of ban, (0, None) if not banned
+        """
+        # a key that cannot be compared with names would fail the whole batch's walk
+        if not isinstance(user, str):
+            raise TypeError(f"user must be a str, not {type(user).__name__}")
+
+        self.checks += 1
+        future = self.pendingChecks.get(user)
+        if (future is None):
+            future = asyncio.get_running_loop().create_future()
+            self.pendingChecks[user] = future
+            self.scheduleFlush()
+        else:
+            self.coalescedChecks += 1
+
+        # a caller giving up must not cancel the answer for everyone else
+        return await asyncio.shield(future)
+
+    async def isBanned(self, user):
+        """
+        :param user: name of the user to check
+        :return: true if the user has been banned from any server
+        """
+        count, _ = await self.getBan(user)
+        return count > 0
+
+    async def addBan(self, user, serverBannedOn, timeOfBan):
+        """
+        Queue a ban and wait until it is in the tree. Checks made after this returns
+        see the ban
+        :param user: name of user who has been banned
+        :param serverBannedOn: server number ban resulted on
+        :param timeOfBan: exact time they were banned on said server
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pendingBans.append((user, serverBannedOn, timeOfBan, future))
+        self.scheduleFlush()
+        await asyncio.shield(future)
+
+    def flush(self):
+        """
+        Put the next slice of queued bans in the tree, then answer every waiting check
+        with one walk of the tree
+        """
+        self.flushHandle = None
+
+        for _ in range(min(self.insertSlice, len(self.pendingBans))):
+            user, serverBannedOn, timeOfBan, future = self.pendingBans.popleft()
+            try:
+                if (isinstance(self.tree, AVLTree)):
+                    self.root = self.tree.insert(self.root, user, serverBannedOn, timeOfBan)
+                else:
+                    self.tree.insert(user, serverBannedOn, timeOfBan)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            if not future.done():
+                future.set_result(None)
+
+        waiting = self.pendingChecks
+        self.pendingChecks = dict()
+        if (waiting):
+            self.batches += 1
+            try:
+                results = self.tree.getPlayers(self.currentRoot(), waiting)
+            except Exception as error:
+                # fail every check in the batch rather than leave them waiting forever
+                for future in waiting.values():
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for user, future in waiting.items():
+                    if not future.done():
+                        future.set_result(results[user])
+
+        if (self.pendingBans or self.pendingChecks):
+            self.scheduleFlush()
@@ -0,0 +1,290 @@
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from main import AVLTree, BanFileReader, BTree, RadixTree, ScapeGoatTree
+
+
+# Benchmarks for the ban trees, run with: python benchmark.py memory|walk|bulk|batch [rows]
+# or, for the full suite written out as JSON: python benchmark.py suite [rows] [results.json]
+
+
+NAME_CHARS = "abcdefghijklmnopqrstuvwxyz_@$!"
+
+
+def generateBans(rows, distinctUsers=None, order="random", seed=450, duplicateRate=None):
+    """
+    Make synthetic ban rows shaped like sample_griefers.dat
+    :param rows: number of ban rows to make
+    :param distinctUsers: number of different users to spread the bans over,
+    defaults to a third of the rows
+    :param order: random, sorted or reverse order of the rows by user
+    :param seed: seed for the random generator so runs are repeatable
+    :param duplicateRate: share of the rows that are another ban for a user already
+    banned, sets distinctUsers when given
+    :return: list of (user, serverBannedOn, timeOfBan) tuples, typed as BanFileReader reads them
+    """
+    rng = random.Random(seed)
+    if duplicateRate is not None:
+        distinctUsers = max(1, round(rows * (1 - duplicateRate)))
+    if distinctUsers is None:
+        distinctUsers = max(1, rows // 3)
+    distinctUsers = min(distinctUsers, rows)
+
+    # names are drawn until there are enough different ones, short names can repeat
+    users = set()
+    while len(users) < distinctUsers:
+        users.add("".join(rng.choice(NAME_CHARS) for _ in range(rng.randint(4, 12))))
+    users = sorted(users)
+    rng.shuffle(users)
+
+    # every user gets one ban, the remaining rows are more bans for those same users,
+    # so exactly rows - distinctUsers rows are duplicates
+    rowUsers = users + [rng.choice(users) for _ in range(rows - distinctUsers)]
+    rng.shuffle(rowUsers)
+    bans = [(user, rng.randint(1, 999), rng.randint(1600000000, 1700000000)) for user in rowUsers]
+
+    if (order == "sorted"):
+        bans.sort()
+    elif (order == "reverse"):
+        bans.sort(reverse=True)
+    return bans
+
+
+def buildTree(backend, bans, aggregate=False, alpha=0.72):
+    """
+    Insert every ban into a new tree of the given backend
+    :param alpha: alpha of a scapegoat tree
+    :return: the tree and its root
+    """
+    if (backend == "avl"):
+        tree = AVLTree(aggregate)
+        root = None
+        for user, serverBannedOn, timeOfBan in bans:
+            root = tree.insert(root, user, serverBannedOn, timeOfBan)
+        return tree, root
+
+    # the btree and radix tree always fold each user's bans together
+    if (backend == "btree"):
+        tree = BTree()
+    elif (backend == "radix"):
+        tree = RadixTree()
+    else:
+        tree = ScapeGoatTree(alpha, aggregate)
+    for user, serverBannedOn, timeOfBan in bans:
+        tree.insert(user, serverBannedOn, timeOfBan)
+    return tree, tree.root
+
+
+def memoryPerBan(backend, bans, aggregate=False, alpha=0.72):
+    """
+    Measure the memory the built tree holds on to. The ban strings already exist
+    before the build, so only what the tree allocates is counted
+    :return: bytes per ban row
+    """
+    tracemalloc.start()
+    built = buildTree(backend, bans, aggregate, alpha)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del built
+    return allocated / len(bans)
+
+
+def runMemory(rows):
+    bans = generateBans(rows)
+    print(f"memory for {rows} bans")
+    for backend in ("avl", "scapegoat", "btree", "radix"):
+        for aggregate in (False, True):
+            mode = "aggregate" if aggregate else "per ban"
+            print(f"{backend:>10} {mode:>10}: {memoryPerBan(backend, bans, aggregate):8.1f} bytes per ban")
+
+
+def timeWalks(backend, bans):
+    """
+    Time the build, the full fillOutRecords walk and a lookup for every user
+    :return: seconds taken by each of the three steps
+    """
+    start = time.perf_counter()
+    tree, root = buildTree(backend, bans)
+    built = time.perf_counter()
+
+    playerRecords = tree.fillOutRecords(root, dict())
+    filled = time.perf_counter()
+
+    for user in playerRecords:
+        tree.getPlayer(root, user)
+    looked = time.perf_counter()
+
+    return built - start, filled - built, looked - filled
+
+
+def runWalks(rows):
+    for order in ("sorted", "random"):
+        bans = generateBans(rows, order=order)
+        print(f"{rows} bans in {order} order")
+        for backend in ("avl", "scapegoat", "btree", "radix"):
+            build, fill, lookup = timeWalks(backend, bans)
+            print(f"{backend:>10}: build {build:7.3f}s  fillOutRecords {fill:7.3f}s  lookups {lookup:7.3f}s")
+
+
+def runBulk(rows):
+    bans = generateBans(rows, order="sorted")
+    print(f"{rows} bans in sorted order")
+    for backend in ("avl", "scapegoat", "btree", "radix"):
+        start = time.perf_counter()
+        buildTree(backend, bans)
+        inserted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if (backend == "avl"):
+            AVLTree().buildFromSorted(bans)
+        elif (backend == "btree"):
+            BTree().buildFromSorted(bans)
+        elif (backend == "radix"):
+            RadixTree().buildFromSorted(bans)
+        else:
+            ScapeGoatTree(0.72).buildFromSorted(bans)
+        bulkLoaded = time.perf_counter() - start
+
+        print(f"{backend:>10}: insert each {inserted:7.3f}s  buildFromSorted {bulkLoaded:7.3f}s")
+
+
+def runBatch(rows):
+    bans = generateBans(rows)
+    rng = random.Random(450)
+    for backend in ("avl", "scapegoat", "btree", "radix"):
+        tree, root = buildTree(backend, bans)
+        for queries in (1000, rows // 10, rows):
+            names = [rng.choice(bans)[0] for _ in range(queries)]
+
+            start = time.perf_counter()
+            for user in names:
+                tree.getPlayer(root, user)
+            oneByOne = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tree.getPlayers(root, names)
+            merged = time.perf_counter() - start
+
+            print(f"{backend:>10} {queries:>8} names: getPlayer each {oneByOne:7.3f}s  getPlayers {merged:7.3f}s")
+
+
+def writeGrieferFile(path, bans):
+    """
+    Write ban rows out as a griefer .dat, one "user server time" line per ban
+    """
+    with open(path, "w") as file:
+        for ban in bans:
+            file.write(f"{ban[0]} {ban[1]} {ban[2]}\n")
+
+
+def bestOf(repeats, step):
+    """
+    :param step: function to time, called repeats times
+    :return: the fastest time in seconds and the result of the last call
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = step()
+        taken = time.perf_counter() - start
+        if best is None or taken < best:
+            best = taken
+    return best, result
+
+
+def benchmarkWorkload(datPath, backend, alpha, queries, repeats=3):
+    """
+    Time each step of answering from a griefer file on its own
+    :param datPath: griefer .dat to load
+    :param backend: avl, scapegoat, btree or radix
+    :param alpha: alpha of a scapegoat tree, None for the others
+    :param queries: names to look up, banned and not
+    :param repeats: times to repeat each step, the fastest is kept
+    :return: dictionary of the measurements
+    """
+    parseSeconds, bans = bestOf(repeats, lambda: list(BanFileReader(datPath)))
+    buildSeconds, (tree, root) = bestOf(repeats, lambda: buildTree(backend, bans, alpha=alpha))
+    recordsSeconds, playerRecords = bestOf(repeats, lambda: tree.fillOutRecords(root, dict()))
+    lookupSeconds, _ = bestOf(repeats, lambda: [tree.getPlayer(root, user) for user in queries])
+    batchSeconds, _ = bestOf(repeats, lambda: tree.getPlayers(root, queries))
+
+    return {
+        "parseSeconds": parseSeconds,
+        "buildSeconds": buildSeconds,
+        "recordsSeconds": recordsSeconds,
+        "lookupSeconds": lookupSeconds,
+        "lookupsPerSecond": len(queries) / lookupSeconds,
+        "batchSeconds": batchSeconds,
+        "bytesPerBan": memoryPerBan(backend, bans, alpha=alpha),
+        "users": len(playerRecords),
+    }
+
+
+def runSuite(rows, outputPath, duplicateRates=(0.0, 0.5, 0.9), orders=("random", "sorted", "reverse"),
+             alphas=(0.6, 0.72, 0.85), queryCount=10000, seed=450):
+    """
+    Benchmark every backend, and every alpha for scapegoat, over generated griefer
+    files of each size, duplicate rate and order. Everything is seeded, so a rerun
+    on the same machine is comparable
+    :param rows: largest file size, a tenth of it is also run
+    :param outputPath: JSON file the results are written to
+    :return: list of results, one per workload and backend
+    """
+    results = []
+    configs = [("avl", None)] + [("scapegoat", alpha) for alpha in alphas] + [("btree", None), ("radix", None)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (max(1, rows // 10), rows):
+            for duplicateRate in duplicateRates:
+                for order in orders:
+                    bans = generateBans(size, order=order, seed=seed, duplicateRate=duplicateRate)
+                    datPath = os.path.join(directory, "griefers.dat")
+                    writeGrieferFile(datPath, bans)
+
+                    # half banned users, half names that can not be in the file
+                    rng = random.Random(seed)
+                    queries = [rng.choice(bans)[0] for _ in range(queryCount // 2)]
+                    queries += ["".join(rng.choice("0123456789") for _ in range(8)) for _ in range(queryCount - len(queries))]
+                    rng.shuffle(queries)
+
+                    for backend, alpha in configs:
+                        result = {"rows": size, "duplicateRate": duplicateRate, "order": order,
+                                  "backend": backend, "alpha": alpha}
+                        result.update(benchmarkWorkload(datPath, backend, alpha, queries))
+                        results.append(result)
+                        print(f"{size:>9} rows {duplicateRate:4.2f} dup {order:>8} {backend:>10} {alpha or '':>5}: "
+                              f"build {result['buildSeconds']:7.3f}s  lookups {result['lookupSeconds']:7.3f}s  "
+                              f"batch {result['batchSeconds']:7.3f}s  {result['bytesPerBan']:6.1f} bytes per ban")
+
+    with open(outputPath, "w") as file:
+        json.dump({
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "queries": queryCount,
+            "results": results,
+        }, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    benchmark = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    if (benchmark == "memory"):
+        runMemory(rows)
+    elif (benchmark == "walk"):
+        runWalks(rows)
+    elif (benchmark == "bulk"):
+        runBulk(rows)
+    elif (benchmark == "batch"):
+        runBatch(rows)
+    elif (benchmark == "suite"):
+        runSuite(rows, sys.argv[3] if len(sys.argv) > 3 else "benchmark_results.json")
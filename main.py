@@ -1,12 +1,27 @@
+import bisect
+import collections
+import contextlib
+import gc
 import math
+import mmap
+import multiprocessing
+import os
+import struct
 import sys
+import tempfile
 import time
+from array import array
 
 
-# Implemented: Scapegoat and AVL
+# Implemented: Scapegoat, AVL, a B+tree and a radix tree, plus a memory mapped sorted array for
+# read only lookups
 
 
 class ScapeGoatNode:
+    # fixed attribute slots instead of a per-node __dict__, nodes are made once per ban
+    __slots__ = ("user", "serverBannedOn", "timeOfBan", "left", "right", "parent",
+                 "subtreeSize", "banCount", "banTimes")
+
     def __init__(self, user, serverBannedOn, timeOfBan):
         self.user = user
         self.serverBannedOn = serverBannedOn
@@ -14,9 +29,18 @@ class ScapeGoatNode:
         self.left = None
         self.right = None
         self.parent = None
-        self.amIRoot = False
+        # number of nodes in the subtree rooted here, kept up to date on insert and rebuild
+        self.subtreeSize = 1
+        # bans held by this node, more than one only when the tree aggregates per user
+        self.banCount = 1
+        # time of each ban, in step with serverBannedOn, only when aggregating
+        self.banTimes = None
 
 class AVLNode:
+    # fixed attribute slots instead of a per-node __dict__, nodes are made once per ban
+    __slots__ = ("user", "serverBannedOn", "timeOfBan", "left", "right", "balance", "banCount",
+                 "banTimes", "subtreeSize")
+
     def __init__(self, user, serverBannedOn, timeOfBan):
         # user is key
         self.user = user
@@ -25,35 +49,677 @@ class AVLNode:
         self.left = None
         self.right = None
         self.balance = 0
+        # bans held by this node, more than one only when the tree aggregates per user
+        self.banCount = 1
+        # time of each ban, in step with serverBannedOn, only when aggregating
+        self.banTimes = None
+        # number of nodes in the subtree rooted here, for the order statistic queries
+        self.subtreeSize = 1
+
+
+def addBan(node, serverBannedOn, timeOfBan):
+    """
+    Fold another ban for the node's user into an aggregate node in place
+    :param node: aggregate node for the user, its serverBannedOn is an array
+    :param serverBannedOn: server number ban resulted on
+    :param timeOfBan: exact time they were banned on said server
+    """
+    node.banCount += 1
+    node.serverBannedOn.append(serverBannedOn)
+    node.banTimes.append(timeOfBan)
+    if (node.timeOfBan < timeOfBan):
+        node.timeOfBan = timeOfBan
+
+
+def removeBan(node, serverBannedOn):
+    """
+    Take one ban on the given server out of an aggregate node in place, the node
+    must hold another ban so it stays in the tree
+    :param node: aggregate node for the user holding a ban on serverBannedOn
+    :param serverBannedOn: server number the ban to remove was on
+    :return: time of the ban removed
+    """
+    i = node.serverBannedOn.index(serverBannedOn)
+    del node.serverBannedOn[i]
+    timeOfBan = node.banTimes.pop(i)
+    node.banCount -= 1
+    node.timeOfBan = max(node.banTimes)
+    return timeOfBan
+
+
+def expireBans(node, timestamp):
+    """
+    Drop the bans in an aggregate node made before the timestamp
+    :param node: aggregate node for a user
+    :param timestamp: bans from before this time are dropped
+    :return: number of bans dropped, the node is empty once its banCount is 0
+    """
+    kept = [i for i, timeOfBan in enumerate(node.banTimes) if timeOfBan >= timestamp]
+    removed = node.banCount - len(kept)
+    if (removed):
+        node.serverBannedOn = array('q', [node.serverBannedOn[i] for i in kept])
+        node.banTimes = array('q', [node.banTimes[i] for i in kept])
+        node.banCount = len(kept)
+        if kept:
+            node.timeOfBan = max(node.banTimes)
+    return removed
+
+
+def copyBan(source, node):
+    """
+    Move the ban held by source into node, so a node with two children can be
+    deleted by unlinking its in-order successor instead
+    """
+    node.user = source.user
+    node.serverBannedOn = source.serverBannedOn
+    node.timeOfBan = source.timeOfBan
+    node.banCount = source.banCount
+    node.banTimes = source.banTimes
 
 
+def findBanPath(root, user, serverBannedOn, aggregate):
+    """
+    Find a node holding a ban for the user on the given server. Equal keys can sit
+    on either side of each other, so both children of a matching node are searched
+    :param root: root to walk tree from
+    :param user: name of the banned user
+    :param serverBannedOn: server number the ban was on
+    :param aggregate: true if the nodes hold lists of servers
+    :return: the nodes from the root down to the one found, or None if not found
+    """
+    path = []
+    # nodes still to visit, with how deep they are
+    toVisit = [(root, 0)]
+
+    while toVisit:
+        node, depth = toVisit.pop()
+        if (node is None):
+            continue
+
+        # everything deeper on the path belonged to a branch already searched
+        del path[depth:]
+        path.append(node)
+
+        if (user < node.user):
+            toVisit.append((node.left, depth + 1))
+        elif (user > node.user):
+            toVisit.append((node.right, depth + 1))
+        else:
+            if (aggregate and serverBannedOn in node.serverBannedOn):
+                return path
+            if (not aggregate and node.serverBannedOn == serverBannedOn):
+                return path
+            toVisit.append((node.left, depth + 1))
+            toVisit.append((node.right, depth + 1))
+
+    return None
+
+
+def findPlayer(root, user):
+    """
+    Walk down the tree to find every ban for the user. Only the path towards the key
+    is followed. Equal keys can sit on either side of each other after a rotation or
+    rebuild, so both children of a matching node are searched
+    :param root: root to walk tree from
+    :param user: name of the user to look for
+    :return: number of bans and most recent time of ban, (0, None) if not found
+    """
+    # findPlayerCounted is this walk with a counter, a change here belongs there too
+    count = 0
+    mostRecentTime = None
+    toVisit = [root]
+
+    while toVisit:
+        node = toVisit.pop()
+        if (node is None):
+            continue
+
+        if (user < node.user):
+            toVisit.append(node.left)
+        elif (user > node.user):
+            toVisit.append(node.right)
+        else:
+            count += node.banCount
+            if (mostRecentTime is None or mostRecentTime < node.timeOfBan):
+                mostRecentTime = node.timeOfBan
+            toVisit.append(node.left)
+            toVisit.append(node.right)
+
+    return count, mostRecentTime
+
+
+def findPlayerCounted(root, user):
+    """
+    findPlayer with a count of the nodes it reaches. Only used when stats are kept,
+    so the walk without stats carries no counter
+    :param root: root to walk tree from
+    :param user: name of the user to look for
+    :return: number of bans, most recent time of ban and number of nodes reached
+    """
+    # keep this walk the same as findPlayer's, equal keys included
+    count = 0
+    mostRecentTime = None
+    visited = 0
+    toVisit = [root]
+
+    while toVisit:
+        node = toVisit.pop()
+        if (node is None):
+            continue
+        visited += 1
+
+        if (user < node.user):
+            toVisit.append(node.left)
+        elif (user > node.user):
+            toVisit.append(node.right)
+        else:
+            count += node.banCount
+            if (mostRecentTime is None or mostRecentTime < node.timeOfBan):
+                mostRecentTime = node.timeOfBan
+            toVisit.append(node.left)
+            toVisit.append(node.right)
+
+    return count, mostRecentTime, visited
+
+
+def findPlayers(root, names, results):
+    """
+    Look up many users in a single walk. The names are split at each node between its
+    two subtrees, so a subtree is only entered while one of the names could be in it,
+    and each node is visited at most once
+    :param root: root to walk tree from
+    :param names: sorted names of the users to look for, without repeats
+    :param results: dictionary of each name to a [0, None] record, filled in with its
+    number of bans and most recent time of ban
+    :return: number of nodes reached
+    """
+    # nodes still to visit, with the slice of names that could be below them
+    toVisit = [(root, 0, len(names))]
+    visited = 0
+
+    while toVisit:
+        node, low, high = toVisit.pop()
+        if (node is None or low >= high):
+            continue
+        visited += 1
+
+        # names[low:split] sort before the node, names[split] may be its user
+        split = bisect.bisect_left(names, node.user, low, high)
+        matchEnd = split
+        if (split < high and names[split] == node.user):
+            matchEnd = split + 1
+            record = results[node.user]
+            record[0] += node.banCount
+            if (record[1] is None or record[1] < node.timeOfBan):
+                record[1] = node.timeOfBan
+
+        # equal keys can be on either side of a matching node
+        toVisit.append((node.left, low, matchEnd))
+        toVisit.append((node.right, split, high))
+
+    return visited
+
+
+def inOrderRows(root):
+    """
+    :param root: root to walk tree from
+    :return: generator of (user, number of bans, time of ban) for every node, in user order
+    """
+    toVisit = []
+    current = root
+
+    while toVisit or current is not None:
+        while current is not None:
+            toVisit.append(current)
+            current = current.left
+
+        current = toVisit.pop()
+        yield current.user, current.banCount, current.timeOfBan
+        current = current.right
+
+
+def foldRecords(playerRecords, rows):
+    """
+    Fold rows into player records, adding up each user's bans and keeping their most
+    recent time
+    :param playerRecords: dictionary of user to [number of bans, most recent time]
+    :param rows: iterable of (user, number of bans, time of ban)
+    :return: the dictionary
+    """
+    for user, banCount, timeOfBan in rows:
+        record = playerRecords.get(user)
+        if (record is not None):
+            if record[1] < timeOfBan:
+                record[1] = timeOfBan
+            record[0] += banCount
+        else:
+            playerRecords[user] = [banCount, timeOfBan]
+    return playerRecords
+
+
+def countBefore(root, user, inclusive=False):
+    """
+    Count the nodes whose user sorts before the given one, using the subtree sizes
+    so only one path down the tree is walked
+    :param root: root to walk tree from
+    :param user: name to count up to, it does not need to be in the tree
+    :param inclusive: also count the nodes for the user itself
+    :return: number of nodes before the user
+    """
+    count = 0
+    node = root
+    while node is not None:
+        if (node.user < user or (inclusive and node.user == user)):
+            # the whole left subtree sorts before as well
+            if (node.left is not None):
+                count += node.left.subtreeSize
+            count += 1
+            node = node.right
+        else:
+            node = node.left
+    return count
+
+
+def selectNode(root, k):
+    """
+    :param root: root to walk tree from
+    :param k: position of the node wanted in user order, counting from 0
+    :return: the node at position k
+    """
+    if (root is None or not 0 <= k < root.subtreeSize):
+        raise IndexError(f"no node at position {k}")
+
+    node = root
+    while True:
+        leftSize = node.left.subtreeSize if node.left is not None else 0
+        if (k < leftSize):
+            node = node.left
+        elif (k == leftSize):
+            return node
+        else:
+            k -= leftSize + 1
+            node = node.right
+
+
+def scanPrefix(root, prefix):
+    """
+    In order walk of only the nodes whose user starts with the prefix. Those users
+    sort together straight after the prefix itself, so subtrees before the prefix
+    are stepped over and the walk stops at the first user past the group
+    :param root: root to walk tree from
+    :param prefix: start of the names wanted
+    :return: list of (user, number of bans, time of ban) for every node reached, in
+    user order
+    """
+    rows = []
+    toVisit = []
+    current = root
+
+    while toVisit or current is not None:
+        while current is not None:
+            if (current.user < prefix):
+                current = current.right
+            else:
+                toVisit.append(current)
+                current = current.left
+
+        if not toVisit:
+            break
+        current = toVisit.pop()
+        if (not current.user.startswith(prefix)):
+            break
+        rows.append((current.user, current.banCount, current.timeOfBan))
+        current = current.right
 
-class ScapeGoatTree:
-    def __init__(self, alpha):
-        self.results = []
+    return rows
+
+
+@contextlib.contextmanager
+def pausedGarbageCollector():
+    """
+    Hold off the cyclic garbage collector while a tree or its records are built.
+    Everything made stays alive, so the collections a big build would trigger find
+    nothing to free and only rescan the ever growing tree
+    """
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if (wasEnabled):
+            gc.enable()
+
+
+def sortBans(bans):
+    """
+    Put ban rows in order of user for a bulk load. Rows that are already sorted,
+    like the nightly export, are found in one pass and used as they are
+    :param bans: list of (user, serverBannedOn, timeOfBan) rows
+    :return: the rows sorted by user
+    """
+    for i in range(1, len(bans)):
+        if (bans[i][0] < bans[i - 1][0]):
+            return sorted(bans, key=lambda ban: ban[0])
+    return bans
+
+
+
+class TreeStats:
+    def __init__(self):
+        """
+        Counters for why a tree is slow to build or search, filled in by a tree given
+        this as its stats
+        """
+        # every insert, with how deep it went
+        self.inserts = 0
+        self.insertDepthTotal = 0
+        self.maxInsertDepth = 0
+        # avl rotations, a double rotation counts once here and twice in rotations
+        self.rotations = 0
+        self.doubleRotations = 0
+        # scapegoat rebuilds, with how many nodes were relinked and the time taken
+        self.rebuilds = 0
+        self.rebuiltNodes = 0
+        self.largestRebuild = 0
+        self.rebuildSeconds = 0.0
+        # users looked up by getPlayer and getPlayers, with the nodes they reached
+        self.lookups = 0
+        self.nodesVisited = 0
+
+    def recordInsert(self, depth):
+        """
+        :param depth: edges from the root to where the ban went
+        """
+        self.inserts += 1
+        self.insertDepthTotal += depth
+        if (depth > self.maxInsertDepth):
+            self.maxInsertDepth = depth
+
+    def recordRebuild(self, nodes, seconds):
+        self.rebuilds += 1
+        self.rebuiltNodes += nodes
+        if (nodes > self.largestRebuild):
+            self.largestRebuild = nodes
+        self.rebuildSeconds += seconds
+
+    def recordLookups(self, users, nodesVisited):
+        self.lookups += users
+        self.nodesVisited += nodesVisited
+
+    def report(self):
+        """
+        :return: dictionary of every counter, with the averages worked out
+        """
+        report = dict(vars(self))
+        report["averageInsertDepth"] = self.insertDepthTotal / self.inserts if self.inserts else 0.0
+        report["averageRebuild"] = self.rebuiltNodes / self.rebuilds if self.rebuilds else 0.0
+        report["nodesPerLookup"] = self.nodesVisited / self.lookups if self.lookups else 0.0
+        return report
+
+
+
+class BinaryBanTree:
+    """
+    What ScapeGoatTree and AVLTree share: the lookups, the walks and keeping the
+    optional indexes in step. Each tree keeps only its own linking of nodes. A
+    subclass sets nodeClass and the aggregate, timeIndex, banFilter, resultCache and
+    stats attributes
+    """
+    nodeClass = None
+
+    def newNode(self, user, serverBannedOn, timeOfBan):
+        """
+        Create a node for a ban. Aggregate nodes keep arrays of the servers banned on
+        and the time of each of those bans
+        :return: the new node
+        """
+        if (self.aggregate):
+            node = self.nodeClass(user, array('q', [serverBannedOn]), timeOfBan)
+            node.banTimes = array('q', [timeOfBan])
+            return node
+        return self.nodeClass(user, serverBannedOn, timeOfBan)
+
+    def notifyInsert(self, user, serverBannedOn, timeOfBan):
+        """
+        Keep the time index, bloom filter and result cache, whichever the tree has, in
+        step with a ban going in
+        """
+        if (self.timeIndex is not None):
+            self.timeIndex.insert(user, serverBannedOn, timeOfBan)
+        if (self.banFilter is not None):
+            self.banFilter.add(user)
+        if (self.resultCache is not None):
+            self.resultCache.invalidate(user)
+
+    def notifyBulkLoad(self, bans):
+        """
+        notifyInsert for a bulk load replacing everything in the tree
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
+        """
+        if (self.timeIndex is not None):
+            self.timeIndex.buildFromSorted(bans)
+        if (self.banFilter is not None):
+            for ban in bans:
+                self.banFilter.add(ban[0])
+        if (self.resultCache is not None):
+            self.resultCache.clear()
+
+    def notifyDelete(self, user, serverBannedOn, timeOfBan):
+        """
+        notifyInsert for a ban coming out. A bloom filter cannot drop a user, so a
+        deleted user is left in it and answered by the walk
+        """
+        if (self.timeIndex is not None):
+            self.timeIndex.delete(user, serverBannedOn, timeOfBan)
+        if (self.resultCache is not None):
+            self.resultCache.invalidate(user)
+
+    def inOrderTraversal(self, subRoot, inOrderNodes):
+        """
+        Perform an in order walk of the tree and save the nodes into
+        inOrderNodes
+        :param subRoot: node where we want to start the walk
+        :param inOrderNodes: the list to add our nodes to
+        """
+        toVisit = []
+        current = subRoot
+
+        while toVisit or current is not None:
+            # go as far left as possible, saving the nodes to come back to
+            while current is not None:
+                toVisit.append(current)
+                current = current.left
+
+            current = toVisit.pop()
+            inOrderNodes.append(current)
+            current = current.right
+
+    def keepUnexpired(self, root, timestamp):
+        """
+        The part of expireBefore both trees share. The tree is keyed on user, so every
+        node is checked, and the bans made before the timestamp are dropped from it.
+        Each tree then links the nodes left back together its own way
+        :param root: root of the tree to expire bans from
+        :param timestamp: bans from before this time are dropped
+        :return: the nodes still holding a ban, in user order, and the number of bans dropped
+        """
+        if (self.timeIndex is not None):
+            self.timeIndex.expireBefore(timestamp)
+        if (self.resultCache is not None):
+            self.resultCache.clear()
+
+        inOrderNodes = []
+        self.inOrderTraversal(root, inOrderNodes)
+
+        keptNodes = []
+        removed = 0
+        for node in inOrderNodes:
+            if (self.aggregate):
+                removed += expireBans(node, timestamp)
+                if (node.banCount > 0):
+                    keptNodes.append(node)
+            elif (node.timeOfBan < timestamp):
+                removed += 1
+            else:
+                keptNodes.append(node)
+        return keptNodes, removed
+
+    def getPlayer(self, root, wantedUser):
+        """
+        :param root: root to walk tree from
+        :param wantedUser: name of the user to look for
+        :return: number of bans and most recent time of ban, (0, None) if not found
+        """
+        if (self.banFilter is not None and wantedUser not in self.banFilter):
+            return 0, None
+
+        if (self.stats is not None):
+            count, mostRecentTime, visited = findPlayerCounted(root, wantedUser)
+            self.stats.recordLookups(1, visited)
+        else:
+            count, mostRecentTime = findPlayer(root, wantedUser)
+
+        if (count == 0 and self.banFilter is not None):
+            self.banFilter.falsePositives += 1
+        return count, mostRecentTime
+
+    def getPlayers(self, root, wantedUsers):
+        """
+        Look up many users in a single walk, see findPlayers
+        :param root: root to walk tree from
+        :param wantedUsers: names of the users to look for
+        :return: dictionary of each name to its number of bans and most recent time of
+        ban, (0, None) if not found
+        """
+        names = sorted(set(wantedUsers))
+        results = {user: [0, None] for user in names}
+        if (self.banFilter is not None):
+            names = [user for user in names if user in self.banFilter]
+
+        visited = findPlayers(root, names, results)
+
+        if (self.stats is not None):
+            self.stats.recordLookups(len(names), visited)
+        if (self.banFilter is not None):
+            self.banFilter.falsePositives += sum(1 for user in names if results[user][0] == 0)
+        return {user: (record[0], record[1]) for user, record in results.items()}
+
+    def cachedPlayer(self, root, wantedUser):
+        """
+        getPlayer through the result cache, when the tree has one
+        :param root: root to walk tree from
+        :param wantedUser: name of the user to look for
+        :return: number of bans and most recent time of ban, (0, None) if not found
+        """
+        if (self.resultCache is None):
+            return self.getPlayer(root, wantedUser)
+
+        record = self.resultCache.get(wantedUser)
+        if (record is None):
+            record = self.getPlayer(root, wantedUser)
+            self.resultCache.put(wantedUser, record)
+        return record
+
+    def rank(self, root, user):
+        """
+        :param root: root to walk tree from
+        :param user: name to rank, it does not need to be in the tree
+        :return: number of nodes whose user sorts before the given one
+        """
+        return countBefore(root, user)
+
+    def select(self, root, k):
+        """
+        Find the user at a position in user order, for paging through the banned users.
+        Positions count nodes the same way rank does, so without aggregate a user with
+        several bans takes up several positions
+        :param root: root to walk tree from
+        :param k: position wanted, counting from 0
+        :return: (user, number of bans, most recent time) of the user at position k,
+        taking in all of their bans
+        """
+        user = selectNode(root, k).user
+        return (user,) + findPlayer(root, user)
+
+    def countRange(self, root, low, high):
+        """
+        :param root: root to walk tree from
+        :param low: first name of the range
+        :param high: last name of the range
+        :return: number of nodes whose user is between low and high, inclusive
+        """
+        if (high < low):
+            return 0
+        return countBefore(root, high, True) - countBefore(root, low)
+
+    def prefixScan(self, root, prefix):
+        """
+        :param root: root to walk tree from
+        :param prefix: start of the names wanted
+        :return: list of (user, number of bans, most recent time) for every user whose
+        name starts with the prefix, in user order, the same rows as BTree.prefixScan and
+        RadixTree.prefixScan give
+        """
+        # a user's nodes are next to each other in the walk, so their rows fold in order
+        records = foldRecords(dict(), scanPrefix(root, prefix))
+        return [(user, record[0], record[1]) for user, record in records.items()]
+
+    def fillOutRecords(self, root, playerRecords):
+        """
+        Walk the tree and put each user, number of bans, and most recent time into a
+        dictionary
+        :param root: root to walk tree from
+        :param playerRecords: dictionary to store records in
+        :return: the dictionary
+        """
+        return foldRecords(playerRecords, inOrderRows(root))
+
+
+
+class ScapeGoatTree(BinaryBanTree):
+    nodeClass = ScapeGoatNode
+
+    def __init__(self, alpha, aggregate=False, timeIndex=None, banFilter=None, resultCache=None,
+                 stats=None):
         self.root = None
         self.size = 0
+        # most nodes the tree has held since it was last rebuilt whole, for deletes
+        self.maxSize = 0
         self.alpha = alpha
+        # when set, each node holds every ban for one user instead of a single ban
+        self.aggregate = aggregate
+        # optional TimeIndex kept in step with every insert, delete and expiry
+        self.timeIndex = timeIndex
+        # optional BloomFilter of every user inserted, to skip the walk for unbanned users
+        self.banFilter = banFilter
+        # optional ResultCache of isPlayerBanned lookups, cleared of a user when they change
+        self.resultCache = resultCache
+        # optional TreeStats counting the work done, left as None it costs one check per call
+        self.stats = stats
 
 
     def insert(self, user, serverBannedOn, timeOfBan):
         """
         Insert a new node into the scapegoat tree
         Begin by doing a bst insert, then checking if the depth is greater than
-        the alpha height. If greater, find the highest imbalanced parent. Rebuild the
-        subtree rooted at the scapegoat by reinserting the nodes in the order produced
-        by binary search.
+        the alpha height. If greater, walk back up the parents and take the first one
+        whose cached subtree size is too small for its height as the scapegoat. Rebuild
+        the subtree rooted at the scapegoat into a perfectly balanced one.
+        When aggregating, a ban for a user already in the tree updates their node instead.
         :param user: name of user who has been banned
         :param serverBannedOn: server number ban resulted on
         :param timeOfBan: exact time they were banned on said server
         """
-        insNode = ScapeGoatNode(user, serverBannedOn, timeOfBan)
+        self.notifyInsert(user, serverBannedOn, timeOfBan)
+
         depth = 0
         # if tree empty, the new node will be the root
         if (self.root == None):
+            if (self.stats is not None):
+                self.stats.recordInsert(0)
             self.size += 1
-            self.root = insNode
-            self.root.amIRoot = True
+            self.maxSize = max(self.maxSize, self.size)
+            self.root = self.newNode(user, serverBannedOn, timeOfBan)
             return
 
         curRoot = self.root
@@ -61,7 +727,15 @@ class ScapeGoatTree:
         parentList = []
 
         depth, prevRoot = self.walkAndGetPrevRoot(curRoot, depth, parentList, prevRoot, user)
+        if (self.stats is not None):
+            self.stats.recordInsert(depth)
 
+        # the walk stops on the user's own node when aggregating
+        if (self.aggregate and prevRoot.user == user):
+            addBan(prevRoot, serverBannedOn, timeOfBan)
+            return
+
+        insNode = self.newNode(user, serverBannedOn, timeOfBan)
         insNode.parent = prevRoot
 
         # Now insert the new node
@@ -71,103 +745,157 @@ class ScapeGoatTree:
             insNode.parent.right = insNode
 
         self.size += 1
+        self.maxSize = max(self.maxSize, self.size)
+
+        # every node on the walk gained one descendant
+        for parent in parentList:
+            parent.subtreeSize += 1
 
         # if depth > alphaHeight(tree of size T) find scapegoat and rebalance
         if (depth > self.alphaHeight() + 1):
-            # To find goat, go backward up list of parents until we find highest imbalanced parent
-            # set lowest parent as starting point
-            highestParent = parentList[-1]
+            # To find goat, go backward up list of parents until we find the first
+            # one whose cached subtree size is too small for the height below it
+            scapegoat = self.root
 
             for i, parent in enumerate(parentList[::-1]):
 
-                if (i > self.alphaHeight(parent)):
-                    highestParent = parent
+                if (i + 1 > self.alphaHeight(parent)):
+                    scapegoat = parent
+                    break
 
-            # Do in-order traversal of tree starting at the highest imbalanced parent to get list of sorted vals
-            inOrderNodes = []
-            self.inOrderTraversal(highestParent, inOrderNodes)
+            self.rebuildSubtree(scapegoat)
 
-            # use inOrderNodes to rebuild tree
-            listOfNodesToRet = []
-            self.binarySearch(inOrderNodes, 0, len(inOrderNodes) - 1, listOfNodesToRet)
 
-            if(highestParent.amIRoot):
-                previousRoot = self.root
-                self.root = listOfNodesToRet[0]
-                self.root.amIRoot = True
-                self.root.parent = None
-
-                self.eliminateReferences(listOfNodesToRet)
+    def rebuildSubtree(self, scapegoat):
+        """
+        Rebuild the subtree rooted at the scapegoat into a perfectly balanced one.
+        The in-order walk gives the nodes in sorted order, which are then linked
+        directly into place, so the rebuild is linear in the size of the subtree
+        :param scapegoat: root of the subtree to rebuild
+        """
+        if (self.stats is not None):
+            started = time.perf_counter()
+        savedParent = scapegoat.parent
+        wasLeftChild = savedParent is not None and savedParent.left is scapegoat
+
+        # Do in-order traversal of tree starting at the scapegoat to get list of sorted vals
+        inOrderNodes = []
+        self.inOrderTraversal(scapegoat, inOrderNodes)
+
+        # use inOrderNodes to rebuild tree
+        newSubRoot = self.buildBalanced(inOrderNodes, 0, len(inOrderNodes) - 1)
+        newSubRoot.parent = savedParent
+
+        if (savedParent is None):
+            self.root = newSubRoot
+        elif (wasLeftChild):
+            savedParent.left = newSubRoot
+        else:
+            savedParent.right = newSubRoot
 
-                if previousRoot != self.root:
-                    previousRoot.amIRoot = False
-                else:
-                    previousRoot.amIRoot = True
+        if (self.stats is not None):
+            self.stats.recordRebuild(len(inOrderNodes), time.perf_counter() - started)
 
-                self.reinsertFromSubroot(listOfNodesToRet, prevRoot)
-            else:
-                previousRoot = self.root
-                current = self.root
-                isRight = False
 
-                while current != highestParent:
-                    if(highestParent.user < current.user):
-                        current = current.left
-                        isRight = False
-                    else:
-                        current = current.right
-                        isRight = True
+    def buildFromSorted(self, bans):
+        """
+        Bulk load the tree from a list of ban rows, replacing anything already in it.
+        The rows are sorted by user if they are not already, then linked straight
+        into a perfectly balanced tree, so there is no rebuild churn on the way
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
+        """
+        self.notifyBulkLoad(bans)
 
-                savedParent = current.parent
+        with pausedGarbageCollector():
+            inOrderNodes = []
+            for user, serverBannedOn, timeOfBan in sortBans(bans):
+                if (self.aggregate and inOrderNodes and inOrderNodes[-1].user == user):
+                    addBan(inOrderNodes[-1], serverBannedOn, timeOfBan)
+                else:
+                    inOrderNodes.append(self.newNode(user, serverBannedOn, timeOfBan))
 
-                self.eliminateReferences(listOfNodesToRet)
+            self.size = len(inOrderNodes)
+            self.maxSize = self.size
+            self.root = self.buildBalanced(inOrderNodes, 0, len(inOrderNodes) - 1)
 
-                if previousRoot != self.root:
-                    previousRoot.amIRoot = False
-                else:
-                    previousRoot.amIRoot = True
 
-                # reassign the parent
-                listOfNodesToRet[0].parent = savedParent
+    def delete(self, user, serverBannedOn):
+        """
+        Remove one ban for the user on the given server, for an appeal or a mistaken
+        ban. The node is unlinked as in a plain bst, and once the tree has shrunk below
+        alpha of the most it held since its last full rebuild, the whole tree is
+        rebuilt. When aggregating, the ban is taken out of the user's node and the
+        node only goes once it holds no bans
+        :param user: name of the banned user
+        :param serverBannedOn: server number the ban was on
+        :return: number of bans removed, 0 if there was no such ban
+        """
+        path = findBanPath(self.root, user, serverBannedOn, self.aggregate)
+        if (path is None):
+            return 0
 
-                if isRight:
-                    savedParent.right = listOfNodesToRet[0]
-                else:
-                    savedParent.left = listOfNodesToRet[0]
+        node = path[-1]
+        if (self.aggregate and node.banCount > 1):
+            timeOfBan = removeBan(node, serverBannedOn)
+        else:
+            timeOfBan = node.timeOfBan
+            self.removeNode(node)
+            self.size -= 1
+            if (self.size < self.alpha * self.maxSize):
+                if (self.root is not None):
+                    self.rebuildSubtree(self.root)
+                self.maxSize = self.size
 
-                self.reinsertFromSubroot(listOfNodesToRet, prevRoot)
+        self.notifyDelete(user, serverBannedOn, timeOfBan)
+        return 1
 
 
-    def reinsertFromSubroot(self, listOfNodesToRet, prevRoot):
+    def removeNode(self, node):
         """
-        Given the list of nodes in the correct insertion order, reinsert them
-        below the scapegoat location (scapegoat should be replaced with first node in the
-        insert list before entering this function)
-        :param listOfNodesToRet: list of nodes to insert
-        :param prevRoot: parent while walking
-        :return:
+        Unlink a node from the tree. A node with two children takes the ban of its
+        in-order successor, and the successor, which has no left child, is unlinked
+        :param node: node to remove
         """
-        # now insert from the subroot
-        for i in range(1, len(listOfNodesToRet)):
-            current = self.root
-            insNode = listOfNodesToRet[i]
-            prevRoot = None
+        if (node.left is not None and node.right is not None):
+            successor = node.right
+            while successor.left is not None:
+                successor = successor.left
+            copyBan(successor, node)
+            node = successor
+
+        child = node.left if node.left is not None else node.right
+        parent = node.parent
+        if (child is not None):
+            child.parent = parent
+
+        if (parent is None):
+            self.root = child
+        elif (parent.left is node):
+            parent.left = child
+        else:
+            parent.right = child
+
+        # every node above lost one descendant
+        while parent is not None:
+            parent.subtreeSize -= 1
+            parent = parent.parent
 
-            # perform walk
-            while current is not None:
-                prevRoot = current
-                if (insNode.user < current.user):
-                    current = current.left
-                elif (insNode.user >= current.user):
-                    current = current.right
 
-            insNode.parent = prevRoot
+    def expireBefore(self, timestamp):
+        """
+        Drop every ban made before the timestamp, for a rolling ban window. The tree
+        is keyed on user, so every node is checked anyway, and the nodes left are
+        linked back into a perfectly balanced tree in the same pass
+        :param timestamp: bans from before this time are dropped
+        :return: number of bans dropped
+        """
+        keptNodes, removed = self.keepUnexpired(self.root, timestamp)
 
-            # Now insert the new node
-            if (insNode.user < insNode.parent.user):
-                insNode.parent.left = insNode
-            elif (insNode.user >= insNode.parent.user):
-                insNode.parent.right = insNode
+        if (removed):
+            self.size = len(keptNodes)
+            self.maxSize = self.size
+            self.root = self.buildBalanced(keptNodes, 0, len(keptNodes) - 1)
+        return removed
 
 
     def walkAndGetPrevRoot(self, curRoot, depth, parentList, prevRoot, user):
@@ -184,6 +912,8 @@ class ScapeGoatTree:
         while curRoot is not None:
             prevRoot = curRoot
             parentList.append(prevRoot)
+            if (self.aggregate and user == curRoot.user):
+                break
             # perform bst insert, but track depth and list of parents as we go
             if (user < curRoot.user):
                 curRoot = curRoot.left
@@ -194,118 +924,1086 @@ class ScapeGoatTree:
         return depth, prevRoot
 
 
-    def eliminateReferences(self, listOfNodesToRet):
+    def sizeOfTree(self, node):
+        """
+        Get the size of the tree
+        :param node:
+        :return: the size of the tree rooted at the given node
+        """
+        if node is None:
+            return 0
+        else:
+            return node.subtreeSize
+
+
+    def alphaHeight(self, specifiedRoot=None):
+        """
+        :return: the alpha height of the tree
+        """
+        if (specifiedRoot is None):
+            return math.floor(math.log(self.size, 1 / self.alpha))
+        else:
+            return math.floor(math.log(specifiedRoot.subtreeSize, 1 / self.alpha))
+
+    def buildBalanced(self, inOrderNodes, low, high):
+        """
+        Link the sorted nodes between low and high into a perfectly balanced subtree,
+        taking the middle node as the root of each level
+        :param inOrderNodes: sorted list of nodes to link
+        :param low: lower bound
+        :param high: upper bound
+        :return: root of the balanced subtree, or None if the range is empty
+        """
+        subRoot = None
+        # ranges still to link, with the node they hang under and on which side
+        toLink = [(low, high, None, False)]
+
+        while toLink:
+            low, high, parent, isLeft = toLink.pop()
+            if low > high:
+                continue
+
+            mid = high - ((high - low) // 2)
+            node = inOrderNodes[mid]
+            node.parent = parent
+            node.left = None
+            node.right = None
+            node.subtreeSize = high - low + 1
+
+            if (parent is None):
+                subRoot = node
+            elif (isLeft):
+                parent.left = node
+            else:
+                parent.right = node
+
+            toLink.append((low, mid - 1, node, True))
+            toLink.append((mid + 1, high, node, False))
+
+        return subRoot
+
+
+    def isPlayerBanned(self, wantedUser):
+        """
+        Check if the given player is banned and print accordingly
+        :param wantedUser: name of the user to look for
+        """
+        count, mostRecentTime = self.cachedPlayer(self.root, wantedUser)
+        if (count == 0):
+            print(formatBanStatus(wantedUser, None))
+        else:
+            print(formatBanStatus(wantedUser, [count, mostRecentTime]))
+
+
+class AVLTree(BinaryBanTree):
+    nodeClass = AVLNode
+
+    def __init__(self, aggregate=False, timeIndex=None, banFilter=None, resultCache=None, stats=None):
+        # the root is handed in and returned by insert rather than kept here
+        # when set, each node holds every ban for one user instead of a single ban
+        self.aggregate = aggregate
+        # optional TimeIndex kept in step with every insert, delete and expiry
+        self.timeIndex = timeIndex
+        # optional BloomFilter of every user inserted, to skip the walk for unbanned users
+        self.banFilter = banFilter
+        # optional ResultCache of isPlayerBanned lookups, cleared of a user when they change
+        self.resultCache = resultCache
+        # optional TreeStats counting the work done, left as None it costs one check per call
+        self.stats = stats
+
+    def insert(self, root, user, serverBannedOn, timeOfBan):
+        """
+        Insert a ban into the tree without recursing. Walk down to the insert point
+        saving the path, hang the new node there, then walk the path back up fixing
+        balances until a subtree stops growing or a rotation restores its height
+        :param root: root of the tree to insert into
+        :param user: name of user who has been banned
+        :param serverBannedOn: server number ban resulted on
+        :param timeOfBan: exact time they were banned on said server
+        :return: the root of the tree after the insert
+        """
+        self.notifyInsert(user, serverBannedOn, timeOfBan)
+
+        if(root == None):
+            root = self.newNode(user, serverBannedOn, timeOfBan)
+            if (self.stats is not None):
+                self.stats.recordInsert(0)
+            return root
+
+        # user is key
+        path = []
+        current = root
+        while current is not None:
+            # fold a repeat ban into the user's node, the shape of the tree is unchanged
+            if (self.aggregate and user == current.user):
+                addBan(current, serverBannedOn, timeOfBan)
+                if (self.stats is not None):
+                    self.stats.recordInsert(len(path))
+                return root
+
+            path.append(current)
+            if (user < current.user):
+                current = current.left
+            else:
+                current = current.right
+
+        child = self.newNode(user, serverBannedOn, timeOfBan)
+        if (user < path[-1].user):
+            path[-1].left = child
+        else:
+            path[-1].right = child
+
+        # every node on the walk gained one descendant, rotations below recount theirs
+        for current in path:
+            current.subtreeSize += 1
+        if (self.stats is not None):
+            self.stats.recordInsert(len(path))
+
+        # child is the subtree that just grew by one level
+        for i in range(len(path) - 1, -1, -1):
+            current = path[i]
+            if (current.left is child):
+                current.balance -= 1
+            else:
+                current.balance += 1
+
+            # height is unchanged, nothing above needs fixing
+            if (current.balance == 0):
+                break
+
+            if (current.balance == -1 or current.balance == 1):
+                child = current
+                continue
+
+            if (current.balance < -1 and current.left.balance <= -1):
+                newSubRoot = self.rotRight(current, True)
+            elif (current.balance < -1):
+                newSubRoot = self.rotLeftRight(current)
+            elif (current.right.balance >= 1):
+                newSubRoot = self.rotLeft(current, True)
+            else:
+                newSubRoot = self.rotRightLeft(current)
+
+            # a rotation after an insert brings the subtree back to its old height
+            if (i == 0):
+                return newSubRoot
+            if (path[i - 1].left is current):
+                path[i - 1].left = newSubRoot
+            else:
+                path[i - 1].right = newSubRoot
+            break
+
+        return root
+
+
+    def buildFromSorted(self, bans):
+        """
+        Bulk load a tree from a list of ban rows. The rows are sorted by user if they
+        are not already, then linked straight into a perfectly balanced tree, so
+        there are no rotations on the way
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
+        :return: the root of the new tree
+        """
+        self.notifyBulkLoad(bans)
+
+        with pausedGarbageCollector():
+            inOrderNodes = []
+            for user, serverBannedOn, timeOfBan in sortBans(bans):
+                if (self.aggregate and inOrderNodes and inOrderNodes[-1].user == user):
+                    addBan(inOrderNodes[-1], serverBannedOn, timeOfBan)
+                else:
+                    inOrderNodes.append(self.newNode(user, serverBannedOn, timeOfBan))
+
+            return self.buildBalanced(inOrderNodes, 0, len(inOrderNodes) - 1)
+
+
+    def delete(self, root, user, serverBannedOn):
+        """
+        Remove one ban for the user on the given server, for an appeal or a mistaken
+        ban, without recursing. A node with two children takes the ban of its in-order
+        successor and the successor is unlinked instead. The saved path is then walked
+        back up fixing balances, rotating where needed, until a subtree keeps its
+        height. When aggregating, the ban is taken out of the user's node and the node
+        only goes once it holds no bans
+        :param root: root of the tree to delete from
+        :param user: name of the banned user
+        :param serverBannedOn: server number the ban was on
+        :return: the root of the tree after the delete and the number of bans removed,
+        0 if there was no such ban
+        """
+        path = findBanPath(root, user, serverBannedOn, self.aggregate)
+        if (path is None):
+            return root, 0
+
+        node = path[-1]
+        if (self.aggregate and node.banCount > 1):
+            self.notifyDelete(user, serverBannedOn, removeBan(node, serverBannedOn))
+            return root, 1
+
+        self.notifyDelete(user, serverBannedOn, node.timeOfBan)
+
+        # which side of each node on the path the walk went down
+        wentLeft = [path[i].left is path[i + 1] for i in range(len(path) - 1)]
+
+        if (node.left is not None and node.right is not None):
+            successor = node.right
+            wentLeft.append(False)
+            path.append(successor)
+            while successor.left is not None:
+                successor = successor.left
+                wentLeft.append(True)
+                path.append(successor)
+            copyBan(successor, node)
+            node = successor
+
+        child = node.left if node.left is not None else node.right
+        if (len(path) == 1):
+            return child, 1
+        if (wentLeft[-1]):
+            path[-2].left = child
+        else:
+            path[-2].right = child
+
+        # every node above lost one descendant, rotations below recount theirs
+        for i in range(len(path) - 1):
+            path[i].subtreeSize -= 1
+
+        # the subtree on the wentLeft[i] side of path[i] just lost one level
+        for i in range(len(path) - 2, -1, -1):
+            current = path[i]
+            if (wentLeft[i]):
+                current.balance += 1
+            else:
+                current.balance -= 1
+
+            # was even before, the height is unchanged, nothing above needs fixing
+            if (current.balance == -1 or current.balance == 1):
+                break
+            # was leaning to the side that shrank, now one level shorter
+            if (current.balance == 0):
+                continue
+
+            if (current.balance > 1):
+                sibling = current.right
+                if (sibling.balance == 0):
+                    newSubRoot = self.rotLeft(current, False)
+                    current.balance = 1
+                    newSubRoot.balance = -1
+                elif (sibling.balance > 0):
+                    newSubRoot = self.rotLeft(current, True)
+                else:
+                    newSubRoot = self.rotRightLeft(current)
+            else:
+                sibling = current.left
+                if (sibling.balance == 0):
+                    newSubRoot = self.rotRight(current, False)
+                    current.balance = -1
+                    newSubRoot.balance = 1
+                elif (sibling.balance < 0):
+                    newSubRoot = self.rotRight(current, True)
+                else:
+                    newSubRoot = self.rotLeftRight(current)
+
+            if (i == 0):
+                root = newSubRoot
+            elif (wentLeft[i - 1]):
+                path[i - 1].left = newSubRoot
+            else:
+                path[i - 1].right = newSubRoot
+
+            # a rotation about an even sibling leaves the subtree at its old height
+            if (newSubRoot.balance != 0):
+                break
+
+        return root, 1
+
+
+    def expireBefore(self, root, timestamp):
+        """
+        Drop every ban made before the timestamp, for a rolling ban window. The tree
+        is keyed on user, so every node is checked anyway, and the nodes left are
+        linked back into a perfectly balanced tree in the same pass
+        :param root: root of the tree to expire bans from
+        :param timestamp: bans from before this time are dropped
+        :return: the root of the tree after the expiry and the number of bans dropped
+        """
+        keptNodes, removed = self.keepUnexpired(root, timestamp)
+
+        if (removed == 0):
+            return root, 0
+        return self.buildBalanced(keptNodes, 0, len(keptNodes) - 1), removed
+
+
+    def buildBalanced(self, inOrderNodes, low, high):
+        """
+        Link the sorted nodes between low and high into a perfectly balanced subtree,
+        taking the middle node as the root of each level. A perfectly balanced
+        subtree of k nodes is k.bit_length() high, which gives each balance factor
+        :param inOrderNodes: sorted list of nodes to link
+        :param low: lower bound
+        :param high: upper bound
+        :return: root of the balanced subtree, or None if the range is empty
+        """
+        subRoot = None
+        # ranges still to link, with the node they hang under and on which side
+        toLink = [(low, high, None, False)]
+
+        while toLink:
+            low, high, parent, isLeft = toLink.pop()
+            if low > high:
+                continue
+
+            mid = high - ((high - low) // 2)
+            node = inOrderNodes[mid]
+            node.left = None
+            node.right = None
+            node.balance = (high - mid).bit_length() - (mid - low).bit_length()
+            node.subtreeSize = high - low + 1
+
+            if (parent is None):
+                subRoot = node
+            elif (isLeft):
+                parent.left = node
+            else:
+                parent.right = node
+
+            toLink.append((low, mid - 1, node, True))
+            toLink.append((mid + 1, high, node, False))
+
+        return subRoot
+
+
+    def recountSize(self, node):
+        """
+        Recount the subtree size of a node from its children after a rotation
+        """
+        node.subtreeSize = 1
+        if (node.left is not None):
+            node.subtreeSize += node.left.subtreeSize
+        if (node.right is not None):
+            node.subtreeSize += node.right.subtreeSize
+
+
+    def rotLeft(self, root, adjBalance):
+        if not root.right:
+            return root
+
+        newRoot = root.right
+
+        root.right = root.right.left
+        newRoot.left = root
+        self.recountSize(root)
+        self.recountSize(newRoot)
+        if (self.stats is not None):
+            self.stats.rotations += 1
+
+        if (adjBalance):
+            newRoot.balance = 0
+            root.balance = 0
+
+        return newRoot
+
+
+    def rotRight(self, root, adjBalance):
+        if not root.left:
+            return root
+
+        newRoot = root.left
+
+        root.left = root.left.right
+        newRoot.right = root
+        self.recountSize(root)
+        self.recountSize(newRoot)
+        if (self.stats is not None):
+            self.stats.rotations += 1
+
+        if(adjBalance):
+            newRoot.balance = 0
+            root.balance = 0
+
+        return newRoot
+
+
+    def rotLeftRight(self, curNode):
+        if (self.stats is not None):
+            self.stats.doubleRotations += 1
+        curNode.left = self.rotLeft(curNode.left, False)
+        y = self.rotRight(curNode, False)
+        x = y.right
+        z = y.left
+
+        if (y.balance == 0):
+            x.balance = 0
+            z.balance = 0
+        else:
+            if (y.balance > 0):
+                x.balance = 0
+                z.balance = -1
+            else:
+                x.balance = 1
+                z.balance = 0
+            y.balance = 0
+        return y
+
+
+    def rotRightLeft(self, curNode):
+        if (self.stats is not None):
+            self.stats.doubleRotations += 1
+        curNode.right = self.rotRight(curNode.right, False)
+        y = self.rotLeft(curNode, False)
+        x = y.left
+        z = y.right
+
+        if(y.balance == 0):
+            x.balance = 0
+            z.balance = 0
+        else:
+            if(y.balance > 0):
+                x.balance = -1
+                z.balance = 0
+            else:
+                x.balance = 0
+                z.balance = 1
+            y.balance = 0
+        return y
+
+    # ====================================================
+
+    def isPlayerBanned(self, root, wantedUser):
+        """
+        Check if the given player is banned and print accordingly
+        :param root: root to walk tree from
+        :param wantedUser: name of the user to look for
+        """
+        count, mostRecentTime = self.cachedPlayer(root, wantedUser)
+        if (count == 0):
+            print(formatBanStatus(wantedUser, None))
+        else:
+            print(formatBanStatus(wantedUser, [count, mostRecentTime]))
+
+
+class TimeIndex:
+    def __init__(self, byServer=False):
+        """
+        Secondary index of every ban ordered by time of ban, for questions like all
+        bans in the last day or the latest bans on a server, which the user keyed
+        trees can only answer by walking everything. It is an AVLTree whose keys
+        are (time of ban, user), so a range or the latest bans cost O(log n + k)
+        :param byServer: also keep a tree per server, so the same questions can be
+        asked about a single server
+        """
+        self.tree = AVLTree()
+        self.root = None
+        self.byServer = byServer
+        # root of the time ordered tree for each server's bans
+        self.serverRoots = dict()
+
+    def insert(self, user, serverBannedOn, timeOfBan):
+        """
+        :param user: name of user who has been banned
+        :param serverBannedOn: server number ban resulted on
+        :param timeOfBan: exact time they were banned on said server
+        """
+        key = (timeOfBan, user)
+        self.root = self.tree.insert(self.root, key, serverBannedOn, timeOfBan)
+        if (self.byServer):
+            serverRoot = self.serverRoots.get(serverBannedOn)
+            self.serverRoots[serverBannedOn] = self.tree.insert(serverRoot, key, serverBannedOn, timeOfBan)
+
+    def buildFromSorted(self, bans):
+        """
+        Bulk load the index from a list of ban rows, replacing anything already in it
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
+        """
+        rows = [((timeOfBan, user), serverBannedOn, timeOfBan)
+                for user, serverBannedOn, timeOfBan in bans]
+        self.root = self.tree.buildFromSorted(rows)
+
+        self.serverRoots = dict()
+        if (self.byServer):
+            serverRows = dict()
+            for row in rows:
+                serverRows.setdefault(row[1], []).append(row)
+            for serverBannedOn, bansOnServer in serverRows.items():
+                self.serverRoots[serverBannedOn] = self.tree.buildFromSorted(bansOnServer)
+
+    def delete(self, user, serverBannedOn, timeOfBan):
+        """
+        Remove one ban, as the user keyed tree it shadows removes it
+        :param user: name of the banned user
+        :param serverBannedOn: server number the ban was on
+        :param timeOfBan: time of the ban to remove
+        """
+        key = (timeOfBan, user)
+        self.root, _ = self.tree.delete(self.root, key, serverBannedOn)
+        if (self.byServer and serverBannedOn in self.serverRoots):
+            serverRoot, _ = self.tree.delete(self.serverRoots[serverBannedOn], key, serverBannedOn)
+            if (serverRoot is None):
+                del self.serverRoots[serverBannedOn]
+            else:
+                self.serverRoots[serverBannedOn] = serverRoot
+
+    def expireBefore(self, timestamp):
+        """
+        Drop every ban made before the timestamp
+        :param timestamp: bans from before this time are dropped
+        """
+        self.root, _ = self.tree.expireBefore(self.root, timestamp)
+        for serverBannedOn in list(self.serverRoots):
+            serverRoot, _ = self.tree.expireBefore(self.serverRoots[serverBannedOn], timestamp)
+            if (serverRoot is None):
+                del self.serverRoots[serverBannedOn]
+            else:
+                self.serverRoots[serverBannedOn] = serverRoot
+
+    def rootFor(self, serverBannedOn):
+        if (serverBannedOn is None):
+            return self.root
+        if (not self.byServer):
+            raise ValueError("TimeIndex was not built with byServer")
+        return self.serverRoots.get(serverBannedOn)
+
+    def bansBetween(self, start, end, serverBannedOn=None):
+        """
+        In order walk of only the part of the tree between start and end. Subtrees
+        wholly before start are stepped over and the walk stops at the first ban
+        after end
+        :param start: earliest time of ban to include
+        :param end: latest time of ban to include
+        :param serverBannedOn: only bans on this server, needs byServer
+        :return: list of (user, serverBannedOn, timeOfBan) rows, oldest first
+        """
+        bans = []
+        toVisit = []
+        current = self.rootFor(serverBannedOn)
+
+        while toVisit or current is not None:
+            while current is not None:
+                # everything to the left is earlier still
+                if (current.user[0] < start):
+                    current = current.right
+                else:
+                    toVisit.append(current)
+                    current = current.left
+
+            if not toVisit:
+                break
+            current = toVisit.pop()
+            if (current.user[0] > end):
+                break
+            bans.append((current.user[1], current.serverBannedOn, current.timeOfBan))
+            current = current.right
+
+        return bans
+
+    def latestBans(self, count, serverBannedOn=None):
+        """
+        Reverse in order walk from the newest ban, stopping after count bans
+        :param count: number of bans wanted
+        :param serverBannedOn: only bans on this server, needs byServer
+        :return: list of (user, serverBannedOn, timeOfBan) rows, newest first
+        """
+        bans = []
+        toVisit = []
+        current = self.rootFor(serverBannedOn)
+
+        while len(bans) < count and (toVisit or current is not None):
+            while current is not None:
+                toVisit.append(current)
+                current = current.right
+
+            current = toVisit.pop()
+            bans.append((current.user[1], current.serverBannedOn, current.timeOfBan))
+            current = current.left
+
+        return bans
+
+
+
+class BTreeNode:
+    # fixed attribute slots instead of a per-node __dict__
+    __slots__ = ("keys", "children", "counts", "times", "next")
+
+    def __init__(self, isLeaf):
+        # sorted users, or in an internal node the first user of each child after the first
+        self.keys = []
+        if (isLeaf):
+            self.children = None
+            # number of bans and most recent time of ban, in step with keys
+            self.counts = array('q')
+            self.times = array('q')
+        else:
+            self.children = []
+            self.counts = None
+            self.times = None
+        # next leaf in user order, for ordered scans
+        self.next = None
+
+
+class BTree:
+    def __init__(self, order=64):
+        """
+        B+tree of player records keyed on user. Each node holds up to order users in
+        flat lists, so a lookup touches a handful of wide nodes instead of one small
+        node per level, and the leaves are linked in user order. A user's bans are
+        always folded into one entry of their count and most recent time
+        :param order: most keys a node holds before it is split
+        """
+        self.root = BTreeNode(True)
+        self.order = order
+        # number of users in the tree
+        self.size = 0
+
+
+    def insert(self, user, serverBannedOn, timeOfBan):
+        """
+        Insert a ban without recursing. Walk down to the user's leaf saving the path,
+        fold the ban into their entry or add one, then split full nodes back up the path
+        :param user: name of user who has been banned
+        :param serverBannedOn: server number ban resulted on
+        :param timeOfBan: exact time they were banned on said server
+        """
+        path = []
+        node = self.root
+        while node.children is not None:
+            i = bisect.bisect_right(node.keys, user)
+            path.append((node, i))
+            node = node.children[i]
+
+        i = bisect.bisect_left(node.keys, user)
+        if (i < len(node.keys) and node.keys[i] == user):
+            node.counts[i] += 1
+            if (node.times[i] < timeOfBan):
+                node.times[i] = timeOfBan
+            return
+
+        node.keys.insert(i, user)
+        node.counts.insert(i, 1)
+        node.times.insert(i, timeOfBan)
+        self.size += 1
+        if (len(node.keys) <= self.order):
+            return
+
+        # split the leaf in two, the right half's first user goes up to the parent
+        mid = len(node.keys) // 2
+        right = BTreeNode(True)
+        right.keys = node.keys[mid:]
+        right.counts = node.counts[mid:]
+        right.times = node.times[mid:]
+        del node.keys[mid:]
+        del node.counts[mid:]
+        del node.times[mid:]
+        right.next = node.next
+        node.next = right
+        separator = right.keys[0]
+
+        while path:
+            parent, i = path.pop()
+            parent.keys.insert(i, separator)
+            parent.children.insert(i + 1, right)
+            if (len(parent.keys) <= self.order):
+                return
+
+            # the middle key moves up rather than being copied
+            mid = len(parent.keys) // 2
+            separator = parent.keys[mid]
+            right = BTreeNode(False)
+            right.keys = parent.keys[mid + 1:]
+            right.children = parent.children[mid + 1:]
+            del parent.keys[mid:]
+            del parent.children[mid + 1:]
+
+        newRoot = BTreeNode(False)
+        newRoot.keys = [separator]
+        newRoot.children = [self.root, right]
+        self.root = newRoot
+
+
+    def buildFromSorted(self, bans):
+        """
+        Bulk load the tree from a list of ban rows, replacing anything already in it.
+        The rows are sorted by user if they are not already, folded per user into full
+        leaves, and the levels above are built from the leaves up
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
+        """
+        with pausedGarbageCollector():
+            keys = []
+            counts = array('q')
+            times = array('q')
+            for user, serverBannedOn, timeOfBan in sortBans(bans):
+                if (keys and keys[-1] == user):
+                    counts[-1] += 1
+                    if (times[-1] < timeOfBan):
+                        times[-1] = timeOfBan
+                else:
+                    keys.append(user)
+                    counts.append(1)
+                    times.append(timeOfBan)
+
+            self.size = len(keys)
+            level = []
+            for start in range(0, max(1, len(keys)), self.order):
+                leaf = BTreeNode(True)
+                leaf.keys = keys[start:start + self.order]
+                leaf.counts = counts[start:start + self.order]
+                leaf.times = times[start:start + self.order]
+                if level:
+                    level[-1].next = leaf
+                level.append(leaf)
+
+            # each parent takes up to order + 1 children, keyed on the first user below each
+            firstKeys = [node.keys[0] if node.keys else None for node in level]
+            while len(level) > 1:
+                parents = []
+                parentFirstKeys = []
+                for start in range(0, len(level), self.order + 1):
+                    parent = BTreeNode(False)
+                    parent.children = level[start:start + self.order + 1]
+                    parent.keys = firstKeys[start + 1:start + len(parent.children)]
+                    parents.append(parent)
+                    parentFirstKeys.append(firstKeys[start])
+                level = parents
+                firstKeys = parentFirstKeys
+
+            self.root = level[0]
+
+
+    def findLeaf(self, root, user):
+        """
+        :return: the leaf the user is in, or would be in
+        """
+        node = root
+        while node.children is not None:
+            node = node.children[bisect.bisect_right(node.keys, user)]
+        return node
+
+
+    def getPlayer(self, root, wantedUser):
+        """
+        :param root: root to walk tree from
+        :param wantedUser: name of the user to look for
+        :return: number of bans and most recent time of ban, (0, None) if not found
+        """
+        leaf = self.findLeaf(root, wantedUser)
+        i = bisect.bisect_left(leaf.keys, wantedUser)
+        if (i < len(leaf.keys) and leaf.keys[i] == wantedUser):
+            return leaf.counts[i], leaf.times[i]
+        return 0, None
+
+
+    def getPlayers(self, root, wantedUsers):
+        """
+        :param root: root to walk tree from
+        :param wantedUsers: names of the users to look for
+        :return: dictionary of each name to its number of bans and most recent time of
+        ban, (0, None) if not found
+        """
+        return {user: self.getPlayer(root, user) for user in set(wantedUsers)}
+
+
+    def recordsFrom(self, root, low):
+        """
+        Find the leaf of low, then follow the leaf links
+        :param root: root to walk tree from
+        :param low: name to start from, it does not need to be in the tree
+        :return: generator of (user, number of bans, most recent time) for every user
+        from low on, in user order
+        """
+        leaf = self.findLeaf(root, low)
+        i = bisect.bisect_left(leaf.keys, low)
+
+        while leaf is not None:
+            keys = leaf.keys
+            while i < len(keys):
+                yield keys[i], leaf.counts[i], leaf.times[i]
+                i += 1
+            leaf = leaf.next
+            i = 0
+
+
+    def rangeScan(self, root, low, high):
+        """
+        :param root: root to walk tree from
+        :param low: first name of the range
+        :param high: last name of the range
+        :return: list of (user, number of bans, most recent time) in user order
+        """
+        records = []
+        for record in self.recordsFrom(root, low):
+            if (record[0] > high):
+                break
+            records.append(record)
+        return records
+
+
+    def prefixScan(self, root, prefix):
+        """
+        For alt account sweeps. The names starting with the prefix sort together
+        straight after the prefix itself, so the leaves are followed from there to the
+        first name past the group
+        :param root: root to walk tree from
+        :param prefix: start of the names wanted
+        :return: list of (user, number of bans, most recent time) for every user whose
+        name starts with the prefix, in user order
+        """
+        records = []
+        for record in self.recordsFrom(root, prefix):
+            if (not record[0].startswith(prefix)):
+                break
+            records.append(record)
+        return records
+
+
+    def isPlayerBanned(self, wantedUser):
+        """
+        Check if the given player is banned and print accordingly
+        :param wantedUser: name of the user to look for
+        """
+        count, mostRecentTime = self.getPlayer(self.root, wantedUser)
+        if (count == 0):
+            print(formatBanStatus(wantedUser, None))
+        else:
+            print(formatBanStatus(wantedUser, [count, mostRecentTime]))
+
+
+    def fillOutRecords(self, root, playerRecords):
+        """
+        Walk the linked leaves and put each user, number of bans, and most recent time
+        into a dictionary
+        :param root: root to walk tree from
+        :param playerRecords: dictionary to store records in
+        :return: the dictionary
+        """
+        return foldRecords(playerRecords, self.records(root))
+
+
+    def records(self, root):
+        """
+        :param root: root to walk tree from
+        :return: generator of (user, number of bans, most recent time) in user order
+        """
+        leaf = root
+        while leaf.children is not None:
+            leaf = leaf.children[0]
+
+        while leaf is not None:
+            yield from zip(leaf.keys, leaf.counts, leaf.times)
+            leaf = leaf.next
+
+
+class RadixNode:
+    # fixed attribute slots instead of a per-node __dict__
+    __slots__ = ("label", "childChars", "children", "banCount", "timeOfBan")
+
+    def __init__(self, label):
+        # the part of the name on the edge into this node
+        self.label = label
+        # first character of each child's label, sorted, in step with children
+        self.childChars = ""
+        self.children = None
+        # bans for the user whose name ends here, 0 if no name ends here
+        self.banCount = 0
+        self.timeOfBan = None
+
+
+class RadixTree:
+    def __init__(self):
         """
-        Get rid of all the references between parents and children
-        in the list of nodes to reinsert
-        :param listOfNodesToRet:
-        :return:
+        Compressed radix tree of player records keyed on the characters of the user's
+        name. Names sharing a start share the nodes for it, and chains of single
+        children are merged into one edge. A lookup costs the length of the name
+        however many users there are. A user's bans are always folded into one count
+        and most recent time
         """
-        for i, node in enumerate(listOfNodesToRet):
-            if (i != 0 and not listOfNodesToRet[i].amIRoot):
-                if (listOfNodesToRet[i].parent.left == listOfNodesToRet[i]):
-                    listOfNodesToRet[i].parent.left = None
-                else:
-                    listOfNodesToRet[i].parent.right = None
-            listOfNodesToRet[i].parent = None
-            listOfNodesToRet[i].left = None
-            listOfNodesToRet[i].right = None
+        self.root = RadixNode("")
+        # number of users in the tree
+        self.size = 0
 
 
-    def sizeOfTree(self, node):
+    def childFor(self, node, char):
         """
-        Get the size of the tree
-        :param node:
-        :return: the size of the tree rooted at the given node
+        :return: position of the child whose label starts with char, or -1
         """
-        if node is None:
-            return 0
-        else:
-            return self.sizeOfTree(node.left) + self.sizeOfTree(node.right) + 1
+        return node.childChars.find(char) if node.children is not None else -1
 
 
-    def alphaHeight(self, specifiedRoot=None):
+    def addChild(self, node, child):
+        i = bisect.bisect_left(node.childChars, child.label[0])
+        node.childChars = node.childChars[:i] + child.label[0] + node.childChars[i:]
+        if (node.children is None):
+            node.children = []
+        node.children.insert(i, child)
+
+
+    def insert(self, user, serverBannedOn, timeOfBan):
         """
-        :return: the alpha height of the tree
+        Follow the name down the edges. An edge that only shares the start of its label
+        with the rest of the name is split where they part, and whatever is left of the
+        name hangs off as one new edge
+        :param user: name of user who has been banned
+        :param serverBannedOn: server number ban resulted on
+        :param timeOfBan: exact time they were banned on said server
         """
-        if (specifiedRoot is None):
-            return math.floor(math.log(self.size, 1 / self.alpha))
+        node = self.root
+        position = 0
+
+        while position < len(user):
+            i = self.childFor(node, user[position])
+            if (i == -1):
+                child = RadixNode(user[position:])
+                self.addChild(node, child)
+                node = child
+                break
+
+            child = node.children[i]
+            label = child.label
+            if (user.startswith(label, position)):
+                node = child
+                position += len(label)
+                continue
+
+            # split the edge where the label and the name part
+            shared = 1
+            while (position + shared < len(user) and user[position + shared] == label[shared]):
+                shared += 1
+            middle = RadixNode(label[:shared])
+            child.label = label[shared:]
+            middle.childChars = child.label[0]
+            middle.children = [child]
+            node.children[i] = middle
+            node = middle
+            position += shared
+
+        if (node.banCount == 0):
+            self.size += 1
+            node.banCount = 1
+            node.timeOfBan = timeOfBan
         else:
-            return math.floor(math.log(self.sizeOfTree(specifiedRoot), 1 / self.alpha))
+            node.banCount += 1
+            if (node.timeOfBan < timeOfBan):
+                node.timeOfBan = timeOfBan
 
-    def isAlphaBalanced(self, node):
-        """
-        check if the tree is alpha balanced by checking the balances of the left and right subtrees
-        :param node:
-        :return: returns true if balanced, else false
-        """
-        isLeftBal = self.sizeOfTree(node.left) <= self.alpha * self.sizeOfTree(node)
-        isRightBal = self.sizeOfTree(node.right) <= self.alpha * self.sizeOfTree(node)
-        return isLeftBal and isRightBal
 
-    def inOrderTraversal(self, subRoot, inOrderNodes):
+    def buildFromSorted(self, bans):
         """
-        Perform an in order walk of the tree and save the nodes into
-        inOrderNodes
-        :param subRoot: node where we want to start the walk
-        :param inOrderNodes: the list to add our nodes to
-        :return:
+        Load the tree from a list of ban rows, replacing anything already in it. The
+        shape of a radix tree does not depend on insert order, so the rows are
+        inserted as they are
+        :param bans: list of (user, serverBannedOn, timeOfBan) rows
         """
-        if (subRoot):
-            self.inOrderTraversal(subRoot.left, inOrderNodes)
-            inOrderNodes.append(subRoot)
-            self.inOrderTraversal(subRoot.right, inOrderNodes)
+        with pausedGarbageCollector():
+            self.root = RadixNode("")
+            self.size = 0
+            for user, serverBannedOn, timeOfBan in bans:
+                self.insert(user, serverBannedOn, timeOfBan)
 
 
-    def binarySearch(self, inOrderNodes, low, high, listOfNodesToRet):
+    def findNode(self, root, name):
         """
-        Performs a binary search of the given list of nodes
-        :param inOrderNodes: list to perform search on
-        :param low: lower bound
-        :param high: upper bound
-        :param listOfNodesToRet: list of nodes in order they were searched
+        :param root: root to walk tree from
+        :param name: name or start of a name to follow
+        :return: the node the name ends in or ends inside the edge into, with the name
+        spelled out down to and including that node, or (None, None) if no name
+        in the tree starts with it
         """
-        if low > high:
-            return
-
-        mid = high - ((high - low) // 2)
-        listOfNodesToRet.append(inOrderNodes[mid])
+        node = root
+        position = 0
+        spelled = ""
+
+        while position < len(name):
+            i = self.childFor(node, name[position])
+            if (i == -1):
+                return None, None
+            node = node.children[i]
+            label = node.label
+            if (name.startswith(label, position)):
+                spelled += label
+                position += len(label)
+            elif (label.startswith(name[position:])):
+                # the name ends part way along this edge
+                return node, spelled + label
+            else:
+                return None, None
 
-        self.binarySearch(inOrderNodes, low, mid - 1, listOfNodesToRet)
-        self.binarySearch(inOrderNodes, mid + 1, high, listOfNodesToRet)
+        return node, spelled
 
 
     def getPlayer(self, root, wantedUser):
         """
-        Walk tree to find the wanted user. Add them
-        to the results list
-        :param root:
-        :param wantedUser:
+        :param root: root to walk tree from
+        :param wantedUser: name of the user to look for
+        :return: number of bans and most recent time of ban, (0, None) if not found
         """
-        # walk the tree and add the found player to the results list
-        if (root == None):
-            return
+        node = root
+        position = 0
+        while position < len(wantedUser):
+            if (node.children is None):
+                return 0, None
+            i = node.childChars.find(wantedUser[position])
+            if (i == -1):
+                return 0, None
+            node = node.children[i]
+            if (not wantedUser.startswith(node.label, position)):
+                return 0, None
+            position += len(node.label)
+
+        if (node.banCount == 0):
+            return 0, None
+        return node.banCount, node.timeOfBan
+
+
+    def getPlayers(self, root, wantedUsers):
+        """
+        :param root: root to walk tree from
+        :param wantedUsers: names of the users to look for
+        :return: dictionary of each name to its number of bans and most recent time of
+        ban, (0, None) if not found
+        """
+        return {user: self.getPlayer(root, user) for user in set(wantedUsers)}
 
-        if (root.user == wantedUser):
-            self.results.append(root)
 
-        self.getPlayer(root.left, wantedUser)
-        self.getPlayer(root.right, wantedUser)
+    def records(self, node, spelled):
+        """
+        :param node: node to start from
+        :param spelled: the name spelled out down to and including the node
+        :return: generator of (user, number of bans, most recent time) for every name
+        ending at or below the node, in user order
+        """
+        toVisit = [(node, spelled)]
+        while toVisit:
+            node, spelled = toVisit.pop()
+            if (node.banCount):
+                yield spelled, node.banCount, node.timeOfBan
+            if (node.children is not None):
+                # pushed last first, so the smallest comes off next
+                for child in reversed(node.children):
+                    toVisit.append((child, spelled + child.label))
+
+
+    def prefixScan(self, root, prefix):
+        """
+        For alt account sweeps. Only the part of the tree below the prefix is walked
+        :param root: root to walk tree from
+        :param prefix: start of the names wanted
+        :return: list of (user, number of bans, most recent time) for every user whose
+        name starts with the prefix, in user order
+        """
+        node, spelled = self.findNode(root, prefix)
+        if (node is None):
+            return []
+        return list(self.records(node, spelled))
 
 
     def isPlayerBanned(self, wantedUser):
         """
-        Reads input from standard in and check if players are banned
-        Print accordingly
+        Check if the given player is banned and print accordingly
+        :param wantedUser: name of the user to look for
         """
-        self.getPlayer(tree.root, wantedUser)
-        if (len(tree.results) == 0):
-            print(f"{wantedUser} is not currently banned from any servers")
+        count, mostRecentTime = self.getPlayer(self.root, wantedUser)
+        if (count == 0):
+            print(formatBanStatus(wantedUser, None))
         else:
-            mostRecentTime = max(node.timeOfBan for node in self.results)
-            print(f"{wantedUser} was banned {len(tree.results)} times. "
-                  f"Most recently on {mostRecentTime}")
-            self.results = []
+            print(formatBanStatus(wantedUser, [count, mostRecentTime]))
 
 
     def fillOutRecords(self, root, playerRecords):
@@ -316,228 +2014,680 @@ class ScapeGoatTree:
         :param playerRecords: dictionary to store records in
         :return: the dictionary
         """
-        if(root is None):
-            return
+        return foldRecords(playerRecords, self.records(root, root.label))
 
-        self.fillOutRecords(root.left, playerRecords)
 
-        if(root.user in playerRecords):
-            list = playerRecords.get(root.user)
-            if int(list[1]) < int(root.timeOfBan):
-                list[1] = root.timeOfBan
-            list[0] += 1
-            playerRecords[root.user] = list
-        else:
-            playerRecords[root.user] = [1, root.timeOfBan]
-        self.fillOutRecords(root.right, playerRecords)
-        return playerRecords
+class BanFileReader:
+    def __init__(self, path, chunkSize=1 << 20, reportEvery=0, start=0, end=None):
+        """
+        Streams ban rows out of a griefer .dat file. The file is read in large binary
+        chunks and only the rows of the current chunk are held at once
+        :param path: path to the .dat file
+        :param chunkSize: bytes to read from the file at a time
+        :param reportEvery: print progress to stderr after this many lines, 0 for never
+        :param start: byte offset of the first line to read
+        :param end: byte offset to stop reading at, None for the end of the file. Both
+        should be at the start of a line, see lineAlignedRanges
+        """
+        self.path = path
+        self.chunkSize = chunkSize
+        self.reportEvery = reportEvery
+        # where the rows not read yet start
+        self.offset = start
+        self.end = end
+        # progress counters, updated as the rows are read
+        self.bytesRead = 0
+        self.linesRead = 0
+        self.bansRead = 0
+        self.malformedLines = 0
+
+    def __iter__(self):
+        """
+        :return: generator of (user, serverBannedOn, timeOfBan) rows, skipping malformed lines
+        """
+        return self.readRows(True)
 
+    def readNew(self):
+        """
+        Read the rows appended since the last read, like tail -f. A last line without
+        a newline may still be being written, so it is left for the next read
+        :return: generator of the complete new rows
+        """
+        return self.readRows(False)
 
+    def readRows(self, finishLastLine):
+        """
+        :param finishLastLine: parse a last line that has no newline yet
+        :return: generator of the rows from the offset on
+        """
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            # a line cut off by the end of a chunk is finished by the next chunk
+            partialLine = b""
+
+            while True:
+                if (self.end is None):
+                    chunk = file.read(self.chunkSize)
+                else:
+                    chunk = file.read(min(self.chunkSize, self.end - file.tell()))
+                if not chunk:
+                    break
+
+                data = partialLine + chunk
+                lines = data.split(b"\n")
+                partialLine = lines.pop()
+                # the unfinished line is counted with the chunk that finishes it
+                self.offset += len(data) - len(partialLine)
+                self.bytesRead += len(data) - len(partialLine)
+
+                for line in lines:
+                    ban = self.parseLine(line)
+                    if ban is not None:
+                        yield ban
+
+            if (finishLastLine and partialLine):
+                self.offset += len(partialLine)
+                self.bytesRead += len(partialLine)
+                ban = self.parseLine(partialLine)
+                if ban is not None:
+                    yield ban
+
+    def parseLine(self, line):
+        """
+        Split one line into its fields, turning the server and time into ints here so
+        nothing after the load converts or compares strings. Blank lines are skipped,
+        lines without a user, numeric server and numeric time are counted as malformed
+        and skipped
+        :param line: bytes of the line without its newline
+        :return: (user, serverBannedOn, timeOfBan) or None if the line is skipped
+        """
+        fields = line.split()
+        if not fields:
+            return None
 
+        self.linesRead += 1
+        if (self.reportEvery and self.linesRead % self.reportEvery == 0):
+            self.report()
 
+        try:
+            if (len(fields) < 3 or not fields[1].isdigit() or not fields[2].isdigit()):
+                raise ValueError(line)
+            ban = (fields[0].decode(), int(fields[1]), int(fields[2]))
+        except ValueError:
+            # UnicodeDecodeError is a ValueError too
+            self.malformedLines += 1
+            return None
 
-class AVLTree:
-    def __init__(self):
-        self.results = []
-        # self.root = None
+        self.bansRead += 1
+        return ban
 
-    def insert(self, root, user, serverBannedOn, timeOfBan):
-        if(root == None):
-            root = AVLNode(user, serverBannedOn, timeOfBan)
-            return root
+    def report(self):
+        print(f"read {self.linesRead} lines ({self.bytesRead} bytes), "
+              f"{self.bansRead} bans, {self.malformedLines} malformed", file=sys.stderr)
 
-        # user is key
-        if (user < root.user):
-            if (root.left):
-                beforeBalance = root.left.balance
-                root.left = self.insert(root.left, user, serverBannedOn, timeOfBan)
-                afterBalance = root.left.balance
 
-                # left subtree changed height
-                if (beforeBalance == 0 and afterBalance != 0):
-                    root.balance -= 1
 
-            else:
-                root.left = AVLNode(user, serverBannedOn, timeOfBan)
-                root.balance -= 1
+# Snapshot file layout, all integers little endian 64 bit:
+#   header       magic, number of users n, size and mtime in ns of the .dat it was built from
+#   offsets      n + 1 byte offsets of each name in the name table
+#   counts       n ban counts
+#   times        n most recent times of ban
+#   name table   utf-8 names back to back, sorted
+# Every section starts 8 byte aligned so the file can be memory mapped as is.
+SNAPSHOT_MAGIC = b"GRIEFIX2"
+SNAPSHOT_HEADER = struct.Struct("<8sqqq")
 
-        if (root.balance < -1 and root.left.balance <= -1):
-            return self.rotRight(root, True)
-        if (root.balance < -1 and root.left.balance >= 1):
-            return self.rotLeftRight(root)
 
-        if (user >= root.user):
-            if (root.right):
-                beforeBalance = root.right.balance
-                root.right = self.insert(root.right, user, serverBannedOn, timeOfBan)
-                afterBalance = root.right.balance
+def snapshotPath(datPath):
+    return datPath + ".idx"
 
-                # right subtree changed height
-                if (beforeBalance == 0 and afterBalance != 0):
-                    root.balance += 1
 
-            else:
-                root.right = AVLNode(user, serverBannedOn, timeOfBan)
-                root.balance += 1
+def datFingerprint(datPath):
+    """
+    :return: size and mtime in nanoseconds of the .dat, what a snapshot is matched on
+    """
+    status = os.stat(datPath)
+    return status.st_size, status.st_mtime_ns
 
-        if (root.balance > 1 and root.right.balance >= 1):
-            return self.rotLeft(root, True)
-        if (root.balance > 1 and root.right.balance <= -1):
-            return self.rotRightLeft(root)
 
-        return root
+def snapshotSource(indexPath):
+    """
+    :return: the (size, mtime in ns) of the .dat the snapshot was built from, None if
+    there is no readable snapshot
+    """
+    try:
+        with open(indexPath, 'rb') as file:
+            header = file.read(SNAPSHOT_HEADER.size)
+    except OSError:
+        return None
+    if (len(header) < SNAPSHOT_HEADER.size):
+        return None
+    magic, _, datSize, datMtime = SNAPSHOT_HEADER.unpack(header)
+    if (magic != SNAPSHOT_MAGIC):
+        return None
+    return datSize, datMtime
+
+
+def isSnapshotFresh(datPath, indexPath):
+    """
+    A snapshot is only used for the exact .dat it was built from. Comparing which file
+    is newer is not enough, a .dat copied with its original mtime kept would still
+    look older than a snapshot of some other version of it
+    :return: true if the snapshot exists and the .dat's size and mtime match the ones
+    it was built from
+    """
+    try:
+        return snapshotSource(indexPath) == datFingerprint(datPath)
+    except OSError:
+        return False
 
 
-    def rotLeft(self, root, adjBalance):
-        if not root.right:
-            return root
+def toLittleEndian(values):
+    if (sys.byteorder == "big"):
+        values.byteswap()
+    return values
 
-        newRoot = root.right
 
-        root.right = root.right.left
-        newRoot.left = root
+def saveSnapshot(playerRecords, indexPath, datSource=(0, 0)):
+    """
+    Write the built player records to a snapshot file, sorted by user.
+    The file is written to a uniquely named file next to its final name and moved
+    into place when complete, so a reader never sees half of one and two runs saving
+    at once do not write into the same file
+    :param playerRecords: dictionary of user to [number of bans, most recent time]
+    :param indexPath: path to write the snapshot to
+    :param datSource: datFingerprint of the .dat the records were built from, taken
+    before it was read
+    """
+    users = sorted(playerRecords)
+    offsets = array('q', [0])
+    counts = array('q')
+    times = array('q')
+    names = []
+
+    for user in users:
+        name = user.encode()
+        names.append(name)
+        offsets.append(offsets[-1] + len(name))
+        counts.append(playerRecords[user][0])
+        times.append(playerRecords[user][1])
+
+    directory, name = os.path.split(os.path.abspath(indexPath))
+    descriptor, tempPath = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(users), *datSource))
+            file.write(toLittleEndian(offsets).tobytes())
+            file.write(toLittleEndian(counts).tobytes())
+            file.write(toLittleEndian(times).tobytes())
+            file.write(b"".join(names))
+        # mkstemp makes the file readable by its owner only
+        os.chmod(tempPath, 0o644)
+        os.replace(tempPath, indexPath)
+    except BaseException:
+        os.unlink(tempPath)
+        raise
+
+
+def readSnapshotArrays(buffer):
+    """
+    Split a snapshot into its sections
+    :param buffer: bytes or memory map of the whole snapshot file
+    :return: offsets, counts and times arrays and where the name table starts
+    """
+    magic, userCount, _, _ = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if (magic != SNAPSHOT_MAGIC):
+        raise ValueError("not a griefer index snapshot")
 
-        if (adjBalance):
-            newRoot.balance = 0
-            root.balance = 0
+    sections = []
+    start = SNAPSHOT_HEADER.size
+    for length in (userCount + 1, userCount, userCount):
+        values = array('q')
+        values.frombytes(buffer[start:start + 8 * length])
+        sections.append(toLittleEndian(values))
+        start += 8 * length
 
-        return newRoot
+    return sections[0], sections[1], sections[2], start
 
 
-    def rotRight(self, root, adjBalance):
-        if not root.left:
-            return root
+def loadSnapshot(indexPath):
+    """
+    Read a snapshot back into player records
+    :param indexPath: path of the snapshot file
+    :return: dictionary of user to [number of bans, most recent time]
+    """
+    with open(indexPath, 'rb') as file:
+        buffer = file.read()
 
-        newRoot = root.left
+    offsets, counts, times, namesStart = readSnapshotArrays(buffer)
+    names = buffer[namesStart:]
 
-        root.left = root.left.right
-        newRoot.right = root
+    playerRecords = dict()
+    with pausedGarbageCollector():
+        for i in range(len(counts)):
+            user = names[offsets[i]:offsets[i + 1]].decode()
+            playerRecords[user] = [counts[i], times[i]]
+    return playerRecords
 
-        if(adjBalance):
-            newRoot.balance = 0
-            root.balance = 0
 
-        return newRoot
+def recordsFromBans(bans):
+    """
+    Fold ban rows straight into player records without building a tree
+    :param bans: iterable of (user, serverBannedOn, timeOfBan) rows
+    :return: dictionary of user to [number of bans, most recent time]
+    """
+    return foldRecords(dict(), ((user, 1, timeOfBan) for user, serverBannedOn, timeOfBan in bans))
 
 
-    def rotLeftRight(self, curNode):
-        curNode.left = self.rotLeft(curNode.left, False)
-        y = self.rotRight(curNode, False)
-        x = y.right
-        z = y.left
 
-        if (y.balance == 0):
-            x.balance = 0
-            z.balance = 0
+class SortedArrayIndex:
+    def __init__(self, indexPath):
+        """
+        Read only lookups straight out of a memory mapped snapshot file. Users are
+        found by binary search over the sorted name table, so no Python object is
+        made per record and processes opening the same file share its pages
+        :param indexPath: path of a snapshot written by saveSnapshot
+        """
+        with open(indexPath, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, _, _ = SNAPSHOT_HEADER.unpack_from(self.buffer, 0)
+        if (magic != SNAPSHOT_MAGIC):
+            raise ValueError("not a griefer index snapshot")
+
+        if (sys.byteorder == "little"):
+            # view the arrays in place
+            view = memoryview(self.buffer)
+            start = SNAPSHOT_HEADER.size
+            self.offsets = view[start:start + 8 * (self.size + 1)].cast('q')
+            start += 8 * (self.size + 1)
+            self.counts = view[start:start + 8 * self.size].cast('q')
+            start += 8 * self.size
+            self.times = view[start:start + 8 * self.size].cast('q')
+            self.namesStart = start + 8 * self.size
+            view.release()
         else:
-            if (y.balance > 0):
-                x.balance = -1
-                z.balance = 0
+            self.offsets, self.counts, self.times, self.namesStart = readSnapshotArrays(self.buffer)
+
+    def __len__(self):
+        return self.size
+
+    def findUser(self, user):
+        """
+        Binary search the name table. Names are sorted as strings, which is the
+        same order as their utf-8 bytes
+        :param user: name to look for
+        :return: position of the user, or -1 if they are not in the index
+        """
+        key = user.encode()
+        low = 0
+        high = self.size - 1
+
+        while low <= high:
+            mid = (low + high) // 2
+            name = self.buffer[self.namesStart + self.offsets[mid]:self.namesStart + self.offsets[mid + 1]]
+            if (name < key):
+                low = mid + 1
+            elif (name > key):
+                high = mid - 1
             else:
-                x.balance = 0
-                z.balance = 1
-            y.balance = 0
-        return y
+                return mid
+        return -1
 
+    def get(self, user, default=None):
+        """
+        Look the user up the same way as the player records dictionary
+        :return: [number of bans, most recent time] or default if not banned
+        """
+        i = self.findUser(user)
+        if (i == -1):
+            return default
+        return [self.counts[i], self.times[i]]
 
-    def rotRightLeft(self, curNode):
-        curNode.right = self.rotRight(curNode.right, False)
-        y = self.rotLeft(curNode, False)
-        x = y.left
-        z = y.right
+    def __getitem__(self, user):
+        record = self.get(user)
+        if record is None:
+            raise KeyError(user)
+        return record
 
-        if(y.balance == 0):
-            x.balance = 0
-            z.balance = 0
-        else:
-            if(y.balance > 0):
-                x.balance = -1
-                z.balance = 0
-            else:
-                x.balance = 0
-                z.balance = 1
-            y.balance = 0
-        return y
+    def __contains__(self, user):
+        return self.findUser(user) != -1
 
-    def height(self, root):
-        if root is None:
-            return 0
+    def users(self):
+        """
+        :return: generator of every user in the index, in sorted order
+        """
+        for i in range(self.size):
+            yield self.buffer[self.namesStart + self.offsets[i]:self.namesStart + self.offsets[i + 1]].decode()
 
-        return root.balance
+    def close(self):
+        # views into the map have to go before it can be closed
+        for values in (self.offsets, self.counts, self.times):
+            if isinstance(values, memoryview):
+                values.release()
+        self.buffer.close()
 
-    def balance(self, root):
-        if root is None:
-            return 0
 
-        return self.height(root.left) - self.height(root.right)
+class BloomFilter:
+    def __init__(self, expectedUsers, falsePositiveRate=0.01):
+        """
+        Compact set of banned users that can answer "not banned" without a lookup.
+        A user that was added is always found, one that was not is wrongly found
+        about falsePositiveRate of the time, and those still get a real lookup.
+        Users cannot be taken out, so a deleted or expired user stays in the filter
+        and is only ever a false positive. Positions come from the process's string
+        hash, so a filter is only good in the process that built it and its forks
+        :param expectedUsers: number of users the filter is sized for
+        :param falsePositiveRate: wanted chance of a user who was never added being found
+        """
+        expectedUsers = max(1, expectedUsers)
+        self.falsePositiveRate = falsePositiveRate
+        self.bitCount = max(8, math.ceil(-expectedUsers * math.log(falsePositiveRate) / math.log(2) ** 2))
+        self.hashCount = max(1, round(self.bitCount / expectedUsers * math.log(2)))
+        self.bits = bytearray((self.bitCount + 7) // 8)
+        # adds so far, repeat adds of a user included
+        self.added = 0
+
+        # counters for sizing the filter against real traffic
+        self.checks = 0
+        self.rejected = 0
+        # users found by the filter that the lookup then did not find, counted by the caller
+        self.falsePositives = 0
+
+    def add(self, user):
+        # two halves of one hash, combined to give each of the positions
+        userHash = hash(user)
+        first = userHash & 0xFFFFFFFF
+        step = (userHash >> 32) | 1
+        for i in range(self.hashCount):
+            position = (first + i * step) % self.bitCount
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.added += 1
+
+    def __contains__(self, user):
+        self.checks += 1
+        userHash = hash(user)
+        first = userHash & 0xFFFFFFFF
+        step = (userHash >> 32) | 1
+        for i in range(self.hashCount):
+            position = (first + i * step) % self.bitCount
+            if not (self.bits[position >> 3] & (1 << (position & 7))):
+                self.rejected += 1
+                return False
+        return True
+
+    def stats(self):
+        """
+        :return: dictionary of the filter's size and how it has done so far
+        """
+        negatives = self.rejected + self.falsePositives
+        return {
+            "bytes": len(self.bits),
+            "hashes": self.hashCount,
+            "added": self.added,
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "falsePositives": self.falsePositives,
+            "expectedFalsePositiveRate": self.falsePositiveRate,
+            "falsePositiveRate": self.falsePositives / negatives if negatives else 0.0,
+        }
+
+
+class ResultCache:
+    def __init__(self, capacity=4096, timeToLive=None):
+        """
+        Bounded cache of lookup results for the few names checked over and over.
+        The least recently used result goes when it is full, and with a time to
+        live a result is also dropped once it is that old. The tree it sits in
+        front of drops a user's result whenever their bans change
+        :param capacity: most results to keep
+        :param timeToLive: seconds a result stays good for, None to keep it until evicted
+        """
+        self.capacity = capacity
+        self.timeToLive = timeToLive
+        # user to (result, time it goes stale), oldest use first
+        self.results = collections.OrderedDict()
+
+        # counters for sizing the cache against real traffic
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def fillOutRecords(self, root, playerRecords):
+    def get(self, user):
         """
-        Walk the tree and put each user, number of bans, and most recent time into a
-        dictionary
-        :param root: root to walk tree from
-        :param playerRecords: dictionary to store records in
-        :return: the dictionary
+        :return: the cached result for the user, or None if there is none
         """
-        if(root is None):
-            return
+        entry = self.results.get(user)
+        if (entry is None):
+            self.misses += 1
+            return None
+
+        result, staleAt = entry
+        if (staleAt is not None and time.monotonic() >= staleAt):
+            del self.results[user]
+            self.misses += 1
+            return None
+
+        self.results.move_to_end(user)
+        self.hits += 1
+        return result
+
+    def put(self, user, result):
+        staleAt = None
+        if (self.timeToLive is not None):
+            staleAt = time.monotonic() + self.timeToLive
+
+        self.results[user] = (result, staleAt)
+        self.results.move_to_end(user)
+        if (len(self.results) > self.capacity):
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user):
+        self.results.pop(user, None)
+
+    def clear(self):
+        self.results.clear()
+
+    def stats(self):
+        """
+        :return: dictionary of the cache's size and how it has done so far
+        """
+        lookups = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "cached": len(self.results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class FilteredRecords:
+    def __init__(self, playerRecords, banFilter):
+        """
+        Player records behind a BloomFilter, so most unbanned users are answered
+        without touching the records
+        :param playerRecords: player records dictionary, or anything with the same get
+        :param banFilter: BloomFilter holding every user in the records
+        """
+        self.playerRecords = playerRecords
+        self.banFilter = banFilter
 
-        self.fillOutRecords(root.left, playerRecords)
+    def get(self, user, default=None):
+        if (user not in self.banFilter):
+            return default
+        record = self.playerRecords.get(user)
+        if (record is None):
+            self.banFilter.falsePositives += 1
+            return default
+        return record
 
-        if(root.user in playerRecords):
-            list = playerRecords.get(root.user)
-            if int(list[1]) < int(root.timeOfBan):
-                list[1] = root.timeOfBan
-            list[0] += 1
-            playerRecords[root.user] = list
-        else:
-            playerRecords[root.user] = [1, root.timeOfBan]
-        self.fillOutRecords(root.right, playerRecords)
-        return playerRecords
 
-    # ====================================================
+class TreeRecords:
+    def __init__(self, tree, root=None):
+        """
+        Answers each lookup with a walk of the tree rather than from the records walked
+        out of it, so the lookups are counted in the tree's stats and go through its
+        result cache
+        :param tree: AVLTree or ScapeGoatTree to answer from
+        :param root: root of the tree for an AVLTree, a ScapeGoatTree keeps its own
+        """
+        self.tree = tree
+        self.root = root if isinstance(tree, AVLTree) else tree.root
+
+    def get(self, user, default=None):
+        count, mostRecentTime = self.tree.cachedPlayer(self.root, user)
+        if (count == 0):
+            return default
+        return [count, mostRecentTime]
+
+
+def filterRecords(tree, playerRecords, falsePositiveRate=0.01):
+    """
+    Build a BloomFilter of every banned user and put it in front of the tree and the
+    records. A dictionary already answers from one hash lookup, which is cheaper than
+    the filter's, so dictionary records are handed back as they are. Only an AVLTree
+    or ScapeGoatTree checks the filter, it is not handed to any other tree
+    :param tree: tree the records came from, or None
+    :param playerRecords: player records dictionary or SortedArrayIndex
+    :param falsePositiveRate: wanted chance of an unbanned user getting a lookup anyway
+    :return: the BloomFilter and the records to answer from
+    """
+    if (isinstance(playerRecords, SortedArrayIndex)):
+        users = playerRecords.users()
+    else:
+        users = playerRecords.keys()
+
+    banFilter = BloomFilter(len(playerRecords), falsePositiveRate)
+    for user in users:
+        banFilter.add(user)
+
+    if (isinstance(tree, (AVLTree, ScapeGoatTree))):
+        tree.banFilter = banFilter
+    if (isinstance(playerRecords, dict)):
+        return banFilter, playerRecords
+    return banFilter, FilteredRecords(playerRecords, banFilter)
 
-    def getPlayer(self, root, wantedUser):
-        # walk the tree and add the found player to the results list
-        if (root == None):
-            return
 
-        if (root.user == wantedUser):
-            self.results.append(root)
 
-        self.getPlayer(root.left, wantedUser)
-        self.getPlayer(root.right, wantedUser)
+def formatBanStatus(user, record):
+    """
+    :param user: name that was looked up
+    :param record: [number of bans, most recent time], or None if not banned
+    :return: the line printed for the user
+    """
+    if(record is None):
+        return f"{user} is not currently banned from any servers."
+    return f"{user} was banned from {record[0]} servers. most recently on: {record[1]}"
 
-        # return resList
 
-    # def isPlayerBanned(self, root, wantedUser):
-    #     self.getPlayer(root, wantedUser)
-    #     if (len(tree.results) == 0):
-    #         print(f"{wantedUser} is not currently banned from any servers")
-    #     else:
-    #         mostRecentTime = max(node.timeOfBan for node in self.results)
-    #         print(f"{wantedUser} was banned {len(tree.results)} times. "
-    #               f"Most recently on {mostRecentTime}")
-    #         self.results = []
+def readFromStdInBatched(playerRecords, blockSize=1 << 20):
+    """
+    Reads standard in a block at a time and answers every name in the block together.
+    Each distinct name in a block is looked up once, and the block's answers go out
+    in a single write, in the same order and text as readFromStdIn
+    :param playerRecords: player records dictionary, or anything with the same get
+    :param blockSize: bytes to read from standard in at a time
+    """
+    # a line cut off by the end of a block is finished by the next block
+    partialLine = b""
 
-    def isPlayerBanned(self, wantedUser, playerRecords=None):
-        self.getPlayer(tree.root, wantedUser)
-        if (len(tree.results) == 0):
-            print(f"{wantedUser} is not currently banned from any servers.")
+    while True:
+        block = sys.stdin.buffer.read(blockSize)
+        if not block:
+            lines = [partialLine] if partialLine else []
         else:
-            mostRecentTime = max(node.timeOfBan for node in self.results)
-            print(f"{wantedUser} was banned from {len(tree.results)} servers. "
-                  f"most recently on: {mostRecentTime}")
-            self.results = []
+            lines = (partialLine + block).split(b"\n")
+            partialLine = lines.pop()
+
+        names = []
+        for line in lines:
+            fields = line.split()
+            if fields:
+                names.append(fields[0].decode())
+
+        answers = {user: formatBanStatus(user, playerRecords.get(user)) for user in set(names)}
+        if names:
+            sys.stdout.write("\n".join(answers[user] for user in names) + "\n")
+
+        if not block:
+            break
+
+
+class LiveIndex:
+    def __init__(self, tree, root, playerRecords, bans, datOffset, pollInterval=0.5):
+        """
+        Keeps the tree and the player records up to date with a .dat file that is
+        still being appended to. New rows are picked up when a lookup comes in and each
+        one goes into the tree and the records in O(log n), so nothing is rebuilt
+        :param tree: tree the file was loaded into, or None if the records came from a snapshot
+        :param root: root of the tree for an AVLTree
+        :param playerRecords: player records built from the file so far
+        :param bans: BanFileReader the file was loaded with
+        :param datOffset: bytes of the file the player records already cover, as returned
+        by loadIndex. Rows from there on are taken in
+        :param pollInterval: least seconds between two looks at the file
+        """
+        if (not isinstance(playerRecords, dict)):
+            raise ValueError("live updates need player records that can be changed")
+
+        self.tree = tree
+        self.root = root
+        self.playerRecords = playerRecords
+        self.bans = bans
+        self.pollInterval = pollInterval
+        self.lastPoll = time.monotonic()
+
+        # rows appended after the records were built or the snapshot was written are
+        # read on the first poll, not skipped
+        bans.offset = datOffset
+
+    def insert(self, user, serverBannedOn, timeOfBan):
+        if (isinstance(self.tree, AVLTree)):
+            self.root = self.tree.insert(self.root, user, serverBannedOn, timeOfBan)
+        elif (self.tree is not None):
+            self.tree.insert(user, serverBannedOn, timeOfBan)
+
+        foldRecords(self.playerRecords, ((user, 1, timeOfBan),))
+
+    def poll(self, force=False):
+        """
+        Take in the rows appended to the file since the last poll
+        :param force: look at the file even if the poll interval has not passed
+        :return: number of new bans
+        """
+        now = time.monotonic()
+        if (not force and now - self.lastPoll < self.pollInterval):
+            return 0
+        self.lastPoll = now
+
+        added = 0
+        for user, serverBannedOn, timeOfBan in self.bans.readNew():
+            self.insert(user, serverBannedOn, timeOfBan)
+            added += 1
+        return added
+
+    def get(self, user, default=None):
+        """
+        Look the user up the same way as the player records dictionary, after taking
+        in any new bans
+        """
+        self.poll()
+        return self.playerRecords.get(user, default)
 
 
 
-def readFromStdIn(tree, playerRecords=None, root=None):
+def readFromStdIn(tree, playerRecords=None, root=None, batched=False):
     """
     Reads input from standard in and check if players are banned
     Print accordingly
     """
-    if playerRecords == None:
+    if (batched and playerRecords is not None):
+        readFromStdInBatched(playerRecords)
+
+    elif playerRecords == None:
         if(root == None):
             for line in sys.stdin:
                 line = line.rstrip()
@@ -545,29 +2695,174 @@ def readFromStdIn(tree, playerRecords=None, root=None):
         else:
             for line in sys.stdin:
                 line = line.rstrip()
-                tree.isPlayerBanned(line)
+                tree.isPlayerBanned(root, line)
 
     else:
         if (root == None):
             for line in sys.stdin:
                 line = line.rstrip()
                 line = line.split()
-                if(playerRecords.get(line[0]) is None):
-                    print(f"{line[0]} is not currently banned from any servers.")
-                else:
-                    print(f"{line[0]} was banned from {playerRecords[line[0]][0]} servers. "
-                          f"most recently on: {playerRecords[line[0]][1]}")
+                print(formatBanStatus(line[0], playerRecords.get(line[0])))
 
         else:
             for line in sys.stdin:
                 line = line.rstrip()
                 line = line.split()
-                if(playerRecords.get(line[0]) is None):
-                    print(f"{line[0]} is not currently banned from any servers.")
-                else:
-                    print(f"{line[0]} was banned from {playerRecords[line[0]][0]} servers. "
-                          f"most recently on: {playerRecords[line[0]][1]}")
+                print(formatBanStatus(line[0], playerRecords.get(line[0])))
+
+
+
+def lineAlignedRanges(datPath, parts):
+    """
+    Split the .dat into byte ranges of about the same size that each start at the
+    beginning of a line, so every line falls in exactly one range
+    :param parts: number of ranges to split into
+    :return: list of (start, end) byte offsets, empty ranges left out
+    """
+    size = os.path.getsize(datPath)
+    starts = [0]
+    with open(datPath, 'rb') as file:
+        for part in range(1, parts):
+            file.seek(max(size * part // parts - 1, starts[-1]))
+            # move on to just past the next newline
+            file.readline()
+            starts.append(min(file.tell(), size))
+    starts.append(size)
+    return [(start, end) for start, end in zip(starts, starts[1:]) if start < end]
+
+
+def foldRange(datPath, start, end):
+    """
+    Parse one byte range of the .dat and fold its rows into player records. Runs in
+    a worker process, so each worker only reads and parses its own range
+    :param start: byte offset of the range's first line
+    :param end: byte offset the range stops at
+    :return: dictionary of user to [number of bans, most recent time] for the range
+    """
+    with pausedGarbageCollector():
+        return recordsFromBans(BanFileReader(datPath, start=start, end=end))
+
+
+def loadParallel(datPath, ranges):
+    """
+    Fold the .dat into player records over one worker process per range. Every byte
+    is read and parsed once, by one worker. No tree is built: whichever backend was
+    asked for, the records walked out of it would be these same ones, so the workers
+    only fold their rows and the parent folds their records together
+    :param datPath: path to the griefer .dat file
+    :param ranges: line aligned (start, end) byte ranges, see lineAlignedRanges
+    :return: dictionary of user to [number of bans, most recent time]
+    """
+    with multiprocessing.Pool(max(1, len(ranges))) as pool:
+        results = pool.starmap(foldRange, [(datPath, start, end) for start, end in ranges])
+
+    playerRecords = dict()
+    with pausedGarbageCollector():
+        for records in results:
+            if (playerRecords):
+                foldRecords(playerRecords, ((user, record[0], record[1]) for user, record in records.items()))
+            else:
+                playerRecords = records
+    return playerRecords
+
+
+def loadIndex(backend, datPath, aggregate=False, bulk=False, saveIndex=False, bans=None, workers=0,
+              stats=None):
+    """
+    Get the player records the queries are answered from. A snapshot built from
+    this exact .dat is reused, otherwise the rows are built into the backend's tree and walked
+    :param backend: avl, scapegoat, btree, radix or sorted
+    :param datPath: path to the griefer .dat file
+    :param aggregate: keep one node per user holding all of their bans
+    :param bulk: build the tree in one pass from the sorted rows
+    :param saveIndex: save the built records as a snapshot for later runs
+    :param bans: reader for the .dat, a new BanFileReader if not given
+    :param workers: fold the rows into records over this many worker processes instead
+    of building an avl, scapegoat, btree or radix tree here
+    :param stats: TreeStats for the tree built here to count its work in
+    :return: the tree, its root, the player records and the bytes of the .dat they
+    cover, for LiveIndex to follow on from. Tree and root are None when nothing was
+    built here. The sorted backend's records are a SortedArrayIndex, which cannot take
+    in new rows, so the bytes covered are None for it
+    """
+    if (bans is None):
+        bans = BanFileReader(datPath)
+    indexPath = snapshotPath(datPath)
+    tree = None
+    root = None
+    # taken before reading, so a .dat changed during the build does not match the snapshot
+    datSource = datFingerprint(datPath)
+
+    if (backend == "sorted"):
+        # answer straight from the memory mapped snapshot, writing it first if needed
+        if (not isSnapshotFresh(datPath, indexPath)):
+            with pausedGarbageCollector():
+                saveSnapshot(recordsFromBans(bans), indexPath, datSource)
+        return tree, root, SortedArrayIndex(indexPath), None
+
+    source = snapshotSource(indexPath)
+    if (source is not None and source == datSource):
+        # the .dat has not changed since the snapshot was written, which covers it up
+        # to the size it had then
+        return tree, root, loadSnapshot(indexPath), source[0]
+
+    if (workers > 1 and backend in ("avl", "scapegoat", "btree", "radix")):
+        ranges = lineAlignedRanges(datPath, workers)
+        playerRecords = loadParallel(datPath, ranges)
+        datOffset = ranges[-1][1] if ranges else 0
+
+    elif (backend == "avl"):
+        tree = AVLTree(aggregate, stats=stats)
+
+        with pausedGarbageCollector():
+            if (bulk):
+                root = tree.buildFromSorted(list(bans))
+            else:
+                for user, serverBannedOn, timeOfBan in bans:
+                    root = tree.insert(root, user, serverBannedOn, timeOfBan)
+
+            # Get all the players in the map
+            playerRecords = tree.fillOutRecords(root, dict())
+
+    elif (backend == "scapegoat"):
+        # Give tree alpha val
+        tree = ScapeGoatTree(0.72, aggregate, stats=stats)
+
+        # Build the tree
+        with pausedGarbageCollector():
+            if (bulk):
+                tree.buildFromSorted(list(bans))
+            else:
+                for user, serverBannedOn, timeOfBan in bans:
+                    tree.insert(user, serverBannedOn, timeOfBan)
+
+            # Get all the players in the map
+            playerRecords = tree.fillOutRecords(tree.root, dict())
+
+    elif (backend == "btree" or backend == "radix"):
+        # a user's bans are always folded together, so aggregate makes no difference
+        tree = BTree() if backend == "btree" else RadixTree()
+
+        with pausedGarbageCollector():
+            if (bulk):
+                tree.buildFromSorted(list(bans))
+            else:
+                for user, serverBannedOn, timeOfBan in bans:
+                    tree.insert(user, serverBannedOn, timeOfBan)
+
+            playerRecords = tree.fillOutRecords(tree.root, dict())
+
+    else:
+        raise ValueError(f"unknown backend {backend}, expected avl, scapegoat, btree, radix or sorted")
+
+    if (tree is not None):
+        # the rows were all read here, up to wherever the file ended
+        datOffset = bans.offset
+
+    if (saveIndex):
+        saveSnapshot(playerRecords, indexPath, datSource)
 
+    return tree, root, playerRecords, datOffset
 
 
 # Remove \n from lines
@@ -618,40 +2913,100 @@ if __name__ == '__main__':
 
     start_time = time.time_ns()
 
-    with open(sys.argv[2], 'r') as file:
-        if (sys.argv[1] == "avl"):
-
-            tree = AVLTree()
-            root = None
-            playerRecords = dict()
-
-            for line in file.readlines():
-                line = line.split()
-                root = tree.insert(root, line[0], line[1], line[2])
-
-            # Get all the players in the map
-            playerRecords = tree.fillOutRecords(root, playerRecords)
-
-            readFromStdIn(tree, playerRecords, root)
-
-
-
-        elif(sys.argv[1] == "scapegoat"):
-            # Give tree alpha val
-            tree = ScapeGoatTree(0.72)
-            root = None
-            playerRecords = dict()
-
-            # Build the tree
-            for line in file.readlines():
-                line = line.split()
-                tree.insert(line[0], line[1], line[2])
-
-            # Get all the players in the map
-            playerRecords = tree.fillOutRecords(tree.root, playerRecords)
-
-            # Read all the potentially banned players and find if they are or not (print out)
-            readFromStdIn(tree, playerRecords)
+    # keep one node per user holding all of their bans
+    aggregate = "--aggregate" in sys.argv[3:]
+    # build the tree in one pass from the sorted rows instead of inserting each one
+    bulk = "--bulk" in sys.argv[3:]
+
+    # print load progress to stderr every million lines
+    progress = "--progress" in sys.argv[3:]
+    # save the built records so later runs can skip the build
+    saveIndex = "--snapshot" in sys.argv[3:]
+    # answer the names on standard in a block at a time instead of line by line
+    batch = "--batch" in sys.argv[3:]
+    # keep taking in bans appended to the .dat while answering
+    follow = "--follow" in sys.argv[3:]
+    # skip the lookup for most unbanned users with a 1% false positive bloom filter
+    bloom = "--bloom" in sys.argv[3:]
+    # fold the .dat into records over one process per core, each reading its own part
+    parallel = "--parallel" in sys.argv[3:]
+    # count rotations, rebuilds and depths while building, answer the names with tree
+    # lookups so they are counted too, and print the counts to stderr
+    stats = TreeStats() if "--stats" in sys.argv[3:] else None
+    # answer names asked for again from a cache of the last N tree lookups, --cache N,
+    # or --cache N:seconds to also drop a result once it is that old
+    resultCache = None
+    if ("--cache" in sys.argv[3:]):
+        cacheOption = sys.argv[sys.argv.index("--cache") + 1].split(":")
+        resultCache = ResultCache(int(cacheOption[0]), float(cacheOption[1]) if len(cacheOption) > 1 else None)
+
+    if (follow and sys.argv[1] == "sorted"):
+        print("--follow cannot be used with the sorted backend, its records are a read only memory map",
+              file=sys.stderr)
+        sys.exit(2)
+
+    bans = BanFileReader(sys.argv[2], reportEvery=1000000 if progress else 0)
+
+    # live updates go into one tree in this process, so it is built here
+    workers = os.cpu_count() if (parallel and not follow) else 0
+
+    tree, root, playerRecords, datOffset = loadIndex(sys.argv[1], sys.argv[2], aggregate, bulk, saveIndex, bans,
+                                                     workers, stats)
+
+    # what the names are answered from
+    answerRecords = playerRecords
+    banFilter = None
+    if (follow):
+        # each name is answered as it comes in, so it sees the newest bans
+        answerRecords = LiveIndex(tree, root, playerRecords, bans, datOffset)
+        batch = False
+    elif ((stats is not None or resultCache is not None) and isinstance(tree, (AVLTree, ScapeGoatTree))):
+        # answer with tree lookups so they are counted too, and go through the cache
+        tree.resultCache = resultCache
+        answerRecords = TreeRecords(tree, root)
+
+    if (resultCache is not None and not isinstance(answerRecords, TreeRecords)):
+        print("--cache ignored: only avl and scapegoat tree lookups are cached, and no tree lookups answer "
+              "the names here (snapshot, --parallel or --follow load, or another backend)", file=sys.stderr)
+        resultCache = None
+
+    if (stats is not None and not isinstance(answerRecords, TreeRecords)):
+        if (tree is None):
+            print("--stats: no tree was built in this process (snapshot, sorted or --parallel load), "
+                  "every count is 0", file=sys.stderr)
+        elif (not isinstance(tree, (AVLTree, ScapeGoatTree))):
+            print(f"--stats: the {sys.argv[1]} backend keeps no stats, every count is 0", file=sys.stderr)
+        else:
+            print("--stats: names were answered from the player records, not tree lookups, "
+                  "so no lookups are counted", file=sys.stderr)
+
+    if (bloom and not follow):
+        if (isinstance(answerRecords, dict)):
+            # the names are answered from the dictionary, not the tree, and a filter in
+            # front of one hash lookup only adds work
+            print("--bloom ignored: answering from a dictionary, use it with sorted, --stats or --cache",
+                  file=sys.stderr)
+        else:
+            # a filter given to the tree is checked by TreeRecords' lookups
+            banFilter, filteredRecords = filterRecords(tree, playerRecords, 0.01)
+            if (not isinstance(answerRecords, TreeRecords)):
+                answerRecords = filteredRecords
+
+    # Read all the potentially banned players and find if they are or not (print out)
+    readFromStdIn(tree, answerRecords, root, batch)
+
+    if (banFilter is not None):
+        print(f"bloom filter: {banFilter.stats()}", file=sys.stderr)
+    if (resultCache is not None):
+        print(f"result cache: {resultCache.stats()}", file=sys.stderr)
+    if (stats is not None):
+        print(f"tree stats: {stats.report()}", file=sys.stderr)
+
+    if (isinstance(playerRecords, SortedArrayIndex)):
+        playerRecords.close()
+
+    if (progress):
+        bans.report()
 
 
     time_taken_in_microseconds = (time.time_ns() - start_time) / 1000.0
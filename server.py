@@ -0,0 +1,266 @@
+import gc
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from main import SortedArrayIndex, formatBanStatus, loadIndex
+
+
+# Long running ban check server. The index is loaded once, then worker processes are
+# forked off to answer over a local socket, sharing the parent's copy of the index.
+#
+#   python server.py <avl|scapegoat|btree|radix|sorted> <griefers.dat> [--port N | --socket PATH] [--workers N]
+#
+# Clients send one name per line and get back one line per name, with the same text
+# main.py prints.
+
+
+def openListener(address):
+    """
+    :param address: port number for TCP on localhost, or a path for a UNIX socket
+    :return: a non-blocking listening socket
+    """
+    if (isinstance(address, int)):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", address))
+    else:
+        if (os.path.exists(address)):
+            os.unlink(address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+
+    listener.listen(socket.SOMAXCONN)
+    # every worker waits on the same listener, whoever loses the race to accept moves on
+    listener.setblocking(False)
+    return listener
+
+
+def answerLines(data, playerRecords):
+    """
+    :param data: complete lines of names received from a client
+    :return: the answers for every non-blank line, encoded to send back
+    """
+    answers = []
+    for line in data.split(b"\n"):
+        fields = line.split()
+        if fields:
+            user = fields[0].decode(errors="replace")
+            answers.append(formatBanStatus(user, playerRecords.get(user)) + "\n")
+    return "".join(answers).encode()
+
+
+def serveConnections(listener, playerRecords):
+    """
+    Worker loop. Accepts clients off the shared listener and answers every complete
+    line a client sends, many clients at a time. Clients are never written to with a
+    blocking send. Answers wait in the client's output buffer until the socket takes
+    them, and a client is not read from again until its buffer has drained, so a
+    client that sends without reading only holds up itself
+    :param listener: listening socket from openListener
+    :param playerRecords: player records dictionary, or anything with the same get
+    """
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    # the unfinished last line from each client
+    partialLines = dict()
+    # answers not yet taken by each client's socket
+    pendingOutput = dict()
+
+    def closeClient(client):
+        selector.unregister(client)
+        del partialLines[client]
+        del pendingOutput[client]
+        client.close()
+
+    def sendPending(client):
+        output = pendingOutput[client]
+        try:
+            sent = client.send(output)
+        except BlockingIOError:
+            sent = 0
+        del output[:sent]
+        # read again only once everything owed to the client has gone out
+        if output:
+            selector.modify(client, selectors.EVENT_WRITE)
+        else:
+            selector.modify(client, selectors.EVENT_READ)
+
+    while True:
+        for key, events in selector.select():
+            if (key.fileobj is listener):
+                try:
+                    client, _ = listener.accept()
+                except BlockingIOError:
+                    continue
+                client.setblocking(False)
+                partialLines[client] = b""
+                pendingOutput[client] = bytearray()
+                selector.register(client, selectors.EVENT_READ)
+                continue
+
+            client = key.fileobj
+            try:
+                if (events & selectors.EVENT_WRITE):
+                    sendPending(client)
+                    continue
+
+                try:
+                    data = client.recv(1 << 16)
+                except BlockingIOError:
+                    continue
+
+                if not data:
+                    closeClient(client)
+                    continue
+
+                data = partialLines[client] + data
+                lastNewline = data.rfind(b"\n")
+                partialLines[client] = data[lastNewline + 1:]
+                if (lastNewline != -1):
+                    pendingOutput[client] += answerLines(data[:lastNewline], playerRecords)
+                    sendPending(client)
+            except ConnectionError:
+                closeClient(client)
+            except Exception:
+                # a bad client costs only its own connection, not the worker
+                traceback.print_exc()
+                closeClient(client)
+
+
+def runServer(playerRecords, address, workers=os.cpu_count()):
+    """
+    Fork the workers and wait on them. The forked workers share the loaded index
+    copy on write. It is frozen out of the garbage collector first, so collections
+    in the workers do not write to, and so copy, the pages holding it
+    :param playerRecords: player records dictionary, or anything with the same get
+    :param address: port number for TCP on localhost, or a path for a UNIX socket
+    :param workers: number of worker processes, 0 to serve from this process
+    """
+    listener = openListener(address)
+
+    if (workers == 0):
+        serveConnections(listener, playerRecords)
+        return
+
+    gc.freeze()
+
+    def startWorker():
+        pid = os.fork()
+        if (pid == 0):
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                serveConnections(listener, playerRecords)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(1)
+        return pid
+
+    # start time of each worker, by pid
+    children = dict()
+    for _ in range(workers):
+        children[startWorker()] = time.monotonic()
+
+    # stop the workers along with the parent
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        # a worker only returns by dying, replace it so the server keeps answering
+        while True:
+            pid, status = os.wait()
+            if (pid not in children):
+                continue
+            started = children.pop(pid)
+            print(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, starting a new one",
+                  file=sys.stderr)
+            # do not spin on a worker that dies as soon as it starts
+            if (time.monotonic() - started < 1):
+                time.sleep(1)
+            children[startWorker()] = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        listener.close()
+        if (not isinstance(address, int) and os.path.exists(address)):
+            os.unlink(address)
+
+
+def queryServer(address, users):
+    """
+    Client side helper, asks a running server about each user
+    :param address: port number or UNIX socket path the server listens on
+    :param users: names to check
+    :return: the server's answer line for each name
+    """
+    if (isinstance(address, int)):
+        connection = socket.create_connection(("127.0.0.1", address))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address)
+
+    outgoing = memoryview("".join(user + "\n" for user in users).encode())
+    received = []
+    # send and receive together, the server stops reading from a client that is not
+    # taking its answers
+    with connection, selectors.DefaultSelector() as selector:
+        connection.setblocking(False)
+        selector.register(connection, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        writing = True
+        while True:
+            if (writing and not outgoing):
+                connection.shutdown(socket.SHUT_WR)
+                selector.modify(connection, selectors.EVENT_READ)
+                writing = False
+
+            for _, events in selector.select():
+                if (events & selectors.EVENT_WRITE and outgoing):
+                    try:
+                        outgoing = outgoing[connection.send(outgoing[:1 << 16]):]
+                    except BlockingIOError:
+                        pass
+                if (events & selectors.EVENT_READ):
+                    try:
+                        data = connection.recv(1 << 16)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        return b"".join(received).decode().splitlines()
+                    received.append(data)
+
+
+def optionValue(name, default):
+    if (name in sys.argv[3:]):
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if __name__ == '__main__':
+    address = int(optionValue("--port", 4500))
+    if ("--socket" in sys.argv[3:]):
+        address = optionValue("--socket", None)
+    workers = int(optionValue("--workers", os.cpu_count()))
+
+    aggregate = "--aggregate" in sys.argv[3:]
+    bulk = "--bulk" in sys.argv[3:]
+    saveIndex = "--snapshot" in sys.argv[3:]
+    loadWorkers = os.cpu_count() if "--parallel" in sys.argv[3:] else 0
+
+    # only the records are needed to answer, the tree can go
+    _, _, playerRecords, _ = loadIndex(sys.argv[1], sys.argv[2], aggregate, bulk, saveIndex, workers=loadWorkers)
+    print(f"serving bans from {sys.argv[2]} on {address} with {workers} workers", file=sys.stderr)
+
+    try:
+        runServer(playerRecords, address, workers)
+    finally:
+        if (isinstance(playerRecords, SortedArrayIndex)):
+            playerRecords.close()
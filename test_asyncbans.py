@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+
+from asyncbans import AsyncBanChecker
+from main import AVLTree, ScapeGoatTree
+
+
+# Tests for asyncbans.py, run with python -m pytest or python -m unittest
+
+BANS = [("griefer", 1, 100), ("griefer", 2, 300), ("other", 1, 200)]
+
+
+def makeCheckers():
+    """
+    :return: a checker over an AVLTree and one over a ScapeGoatTree, both holding BANS
+    """
+    avl = AVLTree()
+    root = avl.buildFromSorted(list(BANS))
+    scapeGoat = ScapeGoatTree(0.72)
+    scapeGoat.buildFromSorted(list(BANS))
+    return [AsyncBanChecker(avl, root), AsyncBanChecker(scapeGoat)]
+
+
+class AsyncBanCheckerTest(unittest.TestCase):
+    def testChecksForOneUserShareALookup(self):
+        async def check(checker):
+            users = ["griefer", "other", "griefer", "nobody", "griefer"]
+            return await asyncio.gather(*(checker.getBan(user) for user in users))
+
+        for checker in makeCheckers():
+            answers = asyncio.run(check(checker))
+            self.assertEqual(answers, [(2, 300), (1, 200), (2, 300), (0, None), (2, 300)])
+            self.assertEqual(checker.checks, 5)
+            self.assertEqual(checker.coalescedChecks, 2)
+            self.assertEqual(checker.batches, 1)
+
+    def testAddedBanIsSeenByLaterChecks(self):
+        async def addThenCheck(checker):
+            before = await checker.isBanned("newcomer")
+            await checker.addBan("newcomer", 3, 400)
+            return before, await checker.getBan("newcomer"), await checker.getBan("griefer")
+
+        for checker in makeCheckers():
+            self.assertEqual(asyncio.run(addThenCheck(checker)), (False, (1, 400), (2, 300)))
+
+    def testNonStringUserIsRejected(self):
+        for checker in makeCheckers():
+            with self.assertRaises(TypeError):
+                asyncio.run(checker.getBan(None))
+            self.assertEqual(checker.checks, 0)
+
+    def testFailedLookupFailsEveryWaitingCheck(self):
+        def failingGetPlayers(root, wantedUsers):
+            raise RuntimeError("lookup failed")
+
+        async def check(checker):
+            answers = await asyncio.gather(checker.getBan("griefer"), checker.getBan("other"),
+                                           return_exceptions=True)
+            # the next batch is answered once the lookup works again
+            del checker.tree.getPlayers
+            return answers, await checker.getBan("griefer")
+
+        for checker in makeCheckers():
+            checker.tree.getPlayers = failingGetPlayers
+            answers, after = asyncio.run(asyncio.wait_for(check(checker), 5))
+            self.assertTrue(all(isinstance(answer, RuntimeError) for answer in answers))
+            self.assertEqual(after, (2, 300))
+
+    def testFailedInsertFailsOnlyItsBan(self):
+        async def addBans(checker):
+            # a name that cannot be compared with the others fails its insert
+            return await asyncio.gather(checker.addBan(7, 1, 500), checker.addBan("newcomer", 1, 600),
+                                        return_exceptions=True)
+
+        for checker in makeCheckers():
+            failed, added = asyncio.run(asyncio.wait_for(addBans(checker), 5))
+            self.assertIsInstance(failed, TypeError)
+            self.assertIsNone(added)
+            self.assertEqual(asyncio.run(checker.getBan("newcomer")), (1, 600))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,603 @@
+import collections
+import contextlib
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from main import (AVLTree, BTree, BanFileReader, BloomFilter, FilteredRecords, LiveIndex, RadixTree,
+                  ResultCache, ScapeGoatTree, TimeIndex, TreeRecords, TreeStats, formatBanStatus,
+                  lineAlignedRanges, loadIndex, loadParallel, recordsFromBans)
+
+
+# Tests for main.py, run with python -m pytest or python -m unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def inOrderNodes(node, nodes):
+    if node is not None:
+        inOrderNodes(node.left, nodes)
+        nodes.append(node)
+        inOrderNodes(node.right, nodes)
+    return nodes
+
+
+def checkAVL(node):
+    """
+    :return: height of the subtree, after checking every balance factor and subtree size in it
+    """
+    if node is None:
+        return 0
+    leftHeight = checkAVL(node.left)
+    rightHeight = checkAVL(node.right)
+    assert node.balance == rightHeight - leftHeight and abs(node.balance) <= 1
+    assert node.subtreeSize == 1 + sizeOf(node.left) + sizeOf(node.right)
+    return 1 + max(leftHeight, rightHeight)
+
+
+def checkScapeGoat(node, parent):
+    """
+    :return: size of the subtree, after checking every parent link and subtree size in it
+    """
+    if node is None:
+        return 0
+    assert node.parent is parent
+    size = 1 + checkScapeGoat(node.left, node) + checkScapeGoat(node.right, node)
+    assert node.subtreeSize == size
+    return size
+
+
+def sizeOf(node):
+    return 0 if node is None else node.subtreeSize
+
+
+def bansIn(root, aggregate):
+    """
+    :return: Counter of the (user, serverBannedOn, timeOfBan) bans held by the tree
+    """
+    bans = collections.Counter()
+    nodes = inOrderNodes(root, [])
+    users = [node.user for node in nodes]
+    assert users == sorted(users)
+    for node in nodes:
+        if aggregate:
+            assert node.banCount == len(node.serverBannedOn) == len(node.banTimes) > 0
+            assert node.timeOfBan == max(node.banTimes)
+            bans.update(zip([node.user] * node.banCount, node.serverBannedOn, node.banTimes))
+        else:
+            bans[(node.user, node.serverBannedOn, node.timeOfBan)] += 1
+    return bans
+
+
+class BinaryTreeTest(unittest.TestCase):
+    def checkTree(self, tree, root, aggregate, model, timeIndex):
+        if isinstance(tree, AVLTree):
+            checkAVL(root)
+        else:
+            self.assertEqual(checkScapeGoat(root, None), tree.size)
+            self.assertFalse(tree.size < tree.alpha * tree.maxSize)
+        self.assertEqual(bansIn(root, aggregate), model)
+
+        users = sorted(set(user for user, _, _ in model.elements()))
+        for user in users + ["", "nobody"]:
+            bans = [ban for ban in model.elements() if ban[0] == user]
+            expected = (len(bans), max(ban[2] for ban in bans)) if bans else (0, None)
+            self.assertEqual(tree.getPlayer(root, user), expected)
+
+        # the order statistics count nodes, the scans give one folded row per user
+        records = recordsFromBans(model.elements())
+        nodes = inOrderNodes(root, [])
+        for user in users[:1] + users[len(users) // 2:][:1] + ["", "u10", "v"]:
+            self.assertEqual(tree.rank(root, user), sum(1 for node in nodes if node.user < user))
+            self.assertEqual(tree.countRange(root, "u1", user),
+                             sum(1 for node in nodes if "u1" <= node.user <= user))
+        for k, node in enumerate(nodes):
+            self.assertEqual(tree.select(root, k), (node.user, *records[node.user]))
+        with self.assertRaises(IndexError):
+            tree.select(root, len(nodes))
+        for prefix in ("", "u", "u1", "u10", "u1x", "v"):
+            self.assertEqual(tree.prefixScan(root, prefix),
+                             [(user, *records[user]) for user in users if user.startswith(prefix)])
+
+        self.checkTimeIndex(timeIndex, model)
+
+    def checkTimeIndex(self, timeIndex, model):
+        """
+        The time index holds exactly the tree's bans, in time order, overall and per server
+        """
+        indexed = timeIndex.bansBetween(0, 10 ** 12)
+        self.assertEqual(collections.Counter(indexed), model)
+        self.assertEqual([ban[2] for ban in indexed], sorted(ban[2] for ban in indexed))
+        for serverBannedOn in (None, 1, 2, 3, 4, 5):
+            bans = [ban for ban in model.elements() if serverBannedOn in (None, ban[1])]
+            times = sorted(ban[2] for ban in bans)
+            for start, end in ((0, 10 ** 12), (300, 600), (500, 500), (700, 200)):
+                self.assertEqual(collections.Counter(timeIndex.bansBetween(start, end, serverBannedOn)),
+                                 collections.Counter(ban for ban in bans if start <= ban[2] <= end))
+            for count in (0, 1, 5, len(bans) + 1):
+                latest = timeIndex.latestBans(count, serverBannedOn)
+                self.assertEqual([ban[2] for ban in latest], times[::-1][:count])
+                self.assertTrue(all(ban in model for ban in latest))
+
+    def runRandomOperations(self, makeTree, seed):
+        rng = random.Random(seed)
+        for trial in range(40):
+            aggregate = rng.random() < 0.5
+            timeIndex = TimeIndex(byServer=True)
+            tree = makeTree(aggregate, timeIndex)
+            isAVL = isinstance(tree, AVLTree)
+            root = None
+            model = collections.Counter()
+            users = [f"u{i}" for i in range(rng.randint(1, 20))]
+
+            for step in range(rng.randint(1, 150)):
+                operation = rng.random()
+                if operation < 0.55:
+                    ban = (rng.choice(users), rng.randint(1, 5), rng.randint(100, 999))
+                    # one ban per user and server, as a delete names only those two
+                    if any(user == ban[0] and server == ban[1] for user, server, _ in model):
+                        continue
+                    if isAVL:
+                        root = tree.insert(root, *ban)
+                    else:
+                        tree.insert(*ban)
+                    model[ban] += 1
+                elif operation < 0.95:
+                    user, serverBannedOn = rng.choice(users), rng.randint(1, 5)
+                    if isAVL:
+                        root, removed = tree.delete(root, user, serverBannedOn)
+                    else:
+                        removed = tree.delete(user, serverBannedOn)
+                    matching = [ban for ban in model if ban[0] == user and ban[1] == serverBannedOn]
+                    self.assertEqual(removed, len(matching))
+                    for ban in matching:
+                        del model[ban]
+                else:
+                    timestamp = rng.randint(100, 999)
+                    if isAVL:
+                        root, removed = tree.expireBefore(root, timestamp)
+                    else:
+                        removed = tree.expireBefore(timestamp)
+                    expired = [ban for ban in model if ban[2] < timestamp]
+                    self.assertEqual(removed, len(expired))
+                    for ban in expired:
+                        del model[ban]
+
+                if not isAVL:
+                    root = tree.root
+                self.checkTree(tree, root, aggregate, model, timeIndex)
+
+    def testAVLInsertDeleteExpire(self):
+        self.runRandomOperations(lambda aggregate, timeIndex: AVLTree(aggregate, timeIndex), 15)
+
+    def testScapeGoatInsertDeleteExpire(self):
+        self.runRandomOperations(lambda aggregate, timeIndex: ScapeGoatTree(0.72, aggregate, timeIndex), 15)
+
+    def testBulkLoadMatchesInserts(self):
+        rng = random.Random(6)
+        bans = [(f"u{rng.randint(1, 50)}", rng.randint(1, 5), rng.randint(100, 999)) for _ in range(500)]
+        for aggregate in (False, True):
+            avl = AVLTree(aggregate, TimeIndex(byServer=True))
+            root = avl.buildFromSorted(list(bans))
+            checkAVL(root)
+            scapeGoat = ScapeGoatTree(0.72, aggregate, TimeIndex(byServer=True))
+            scapeGoat.buildFromSorted(list(bans))
+            checkScapeGoat(scapeGoat.root, None)
+            for tree, treeRoot in ((avl, root), (scapeGoat, scapeGoat.root)):
+                self.assertEqual(bansIn(treeRoot, aggregate), collections.Counter(bans))
+                self.assertEqual(tree.fillOutRecords(treeRoot, dict()), recordsFromBans(bans))
+                self.checkTimeIndex(tree.timeIndex, collections.Counter(bans))
+
+    def testIsPlayerBannedPrintsTheSharedFormat(self):
+        bans = [("griefer", 1, 100), ("griefer", 2, 300), ("other", 1, 200)]
+        avl = AVLTree()
+        root = avl.buildFromSorted(list(bans))
+        scapeGoat = ScapeGoatTree(0.72)
+        scapeGoat.buildFromSorted(list(bans))
+        for user in ("griefer", "other", "nobody"):
+            expected = formatBanStatus(user, recordsFromBans(bans).get(user)) + "\n"
+            for check in (lambda: avl.isPlayerBanned(root, user), lambda: scapeGoat.isPlayerBanned(user)):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    check()
+                self.assertEqual(output.getvalue(), expected)
+
+    def testGetPlayersMatchesGetPlayer(self):
+        rng = random.Random(11)
+        for trial in range(20):
+            users = [f"u{i}" for i in range(rng.randint(1, 60))]
+            bans = [(rng.choice(users), rng.randint(1, 5), rng.randint(100, 999))
+                    for _ in range(rng.randint(0, 200))]
+            wanted = [rng.choice(users + ["", "nobody", "u"]) for _ in range(rng.randint(0, 80))]
+            for aggregate in (False, True):
+                for banFilter in (None, BloomFilter(len(users))):
+                    avl = AVLTree(aggregate, banFilter=banFilter)
+                    root = avl.buildFromSorted(list(bans))
+                    scapeGoat = ScapeGoatTree(0.72, aggregate, banFilter=banFilter)
+                    scapeGoat.buildFromSorted(list(bans))
+                    for tree, treeRoot in ((avl, root), (scapeGoat, scapeGoat.root)):
+                        self.assertEqual(tree.getPlayers(treeRoot, wanted),
+                                         {user: tree.getPlayer(treeRoot, user) for user in wanted})
+
+
+class BTreeTest(unittest.TestCase):
+    def checkNode(self, tree, node, low, high, depth, leafDepths):
+        self.assertEqual(node.keys, sorted(node.keys))
+        self.assertLessEqual(len(node.keys), tree.order)
+        self.assertTrue(all((low is None or key >= low) and (high is None or key < high) for key in node.keys))
+        if node.children is None:
+            self.assertEqual(len(node.keys), len(node.counts))
+            self.assertEqual(len(node.keys), len(node.times))
+            leafDepths.add(depth)
+            return
+        self.assertEqual(len(node.children), len(node.keys) + 1)
+        bounds = [low] + node.keys + [high]
+        for i, child in enumerate(node.children):
+            self.checkNode(tree, child, bounds[i], bounds[i + 1], depth + 1, leafDepths)
+
+    def testSplitsKeepTheTreeValid(self):
+        rng = random.Random(24)
+        for trial in range(60):
+            order = rng.choice([3, 4, 5, 8, 64])
+            users = ["".join(rng.choice("ab_$") for _ in range(rng.randint(1, 6)))
+                     for _ in range(rng.randint(1, 150))]
+            bans = [(rng.choice(users), rng.randint(1, 9), rng.randint(1, 10 ** 6))
+                    for _ in range(rng.randint(0, 400))]
+            model = recordsFromBans(bans)
+
+            for bulk in (False, True):
+                tree = BTree(order)
+                if bulk:
+                    tree.buildFromSorted(list(bans))
+                else:
+                    for ban in bans:
+                        tree.insert(*ban)
+
+                leafDepths = set()
+                self.checkNode(tree, tree.root, None, None, 0, leafDepths)
+                self.assertEqual(len(leafDepths), 1)
+                # the linked leaves run through every user in order
+                self.assertEqual(list(tree.records(tree.root)),
+                                 [(user, model[user][0], model[user][1]) for user in sorted(model)])
+                self.assertEqual(tree.size, len(model))
+                for user in users + ["", "zz"]:
+                    record = model.get(user)
+                    self.assertEqual(tree.getPlayer(tree.root, user),
+                                     (record[0], record[1]) if record else (0, None))
+
+
+class RadixTreeTest(unittest.TestCase):
+    def checkEdges(self, node, isRoot):
+        """
+        Every edge below the root has a label, children are kept sorted by their first
+        character, and a node that ends no name has at least two children
+        """
+        if not isRoot:
+            self.assertTrue(node.label)
+            if node.banCount == 0:
+                self.assertGreaterEqual(len(node.children or []), 2)
+        if node.children is not None:
+            self.assertEqual(node.childChars, "".join(child.label[0] for child in node.children))
+            self.assertEqual(list(node.childChars), sorted(node.childChars))
+            for child in node.children:
+                self.checkEdges(child, False)
+
+    def testEdgeSplitsAndPrefixScan(self):
+        rng = random.Random(25)
+        for trial in range(80):
+            # few characters so names share long starts and edges are split often
+            users = ["".join(rng.choice("ab$") for _ in range(rng.randint(1, 7)))
+                     for _ in range(rng.randint(1, 80))]
+            bans = [(rng.choice(users), rng.randint(1, 9), rng.randint(1, 10 ** 6))
+                    for _ in range(rng.randint(0, 300))]
+            model = recordsFromBans(bans)
+
+            for bulk in (False, True):
+                tree = RadixTree()
+                if bulk:
+                    tree.buildFromSorted(list(bans))
+                else:
+                    for ban in bans:
+                        tree.insert(*ban)
+
+                self.checkEdges(tree.root, True)
+                self.assertEqual(tree.fillOutRecords(tree.root, dict()), model)
+                self.assertEqual(tree.size, len(model))
+                for user in users + ["", "c", users[0][:-1]]:
+                    record = model.get(user)
+                    self.assertEqual(tree.getPlayer(tree.root, user),
+                                     (record[0], record[1]) if record else (0, None))
+                for prefix in ("", "a", "ab", "b$", users[0][:2], "c"):
+                    self.assertEqual(tree.prefixScan(tree.root, prefix),
+                                     [(user, model[user][0], model[user][1])
+                                      for user in sorted(model) if user.startswith(prefix)])
+
+
+class PrefixScanTest(unittest.TestCase):
+    def testEveryBackendGivesTheSameSweep(self):
+        rng = random.Random(25)
+        users = ["".join(rng.choice("ab$") for _ in range(rng.randint(1, 6))) for _ in range(60)]
+        bans = [(rng.choice(users), rng.randint(1, 9), rng.randint(1, 10 ** 6)) for _ in range(300)]
+        model = recordsFromBans(bans)
+
+        backends = {"btree": BTree(4), "radix": RadixTree()}
+        for aggregate in (False, True):
+            backends[f"avl aggregate={aggregate}"] = AVLTree(aggregate)
+            backends[f"scapegoat aggregate={aggregate}"] = ScapeGoatTree(0.72, aggregate)
+        roots = dict()
+        for name, tree in backends.items():
+            # the binary trees hold some bans each way, the others are inserted one at a time
+            if isinstance(tree, AVLTree):
+                roots[name] = tree.buildFromSorted(bans[:150])
+                for ban in bans[150:]:
+                    roots[name] = tree.insert(roots[name], *ban)
+            else:
+                for ban in bans:
+                    tree.insert(*ban)
+                roots[name] = tree.root
+
+        for prefix in ("", "a", "b", "$", "ab", "a$b", "ba$a", "c", users[0], users[0] + "a"):
+            expected = [(user, model[user][0], model[user][1])
+                        for user in sorted(model) if user.startswith(prefix)]
+            for name, tree in backends.items():
+                with self.subTest(backend=name, prefix=prefix):
+                    self.assertEqual(tree.prefixScan(roots[name], prefix), expected)
+
+
+class TreeStatsTest(unittest.TestCase):
+    def testAVLCountsInsertsAndRotations(self):
+        stats = TreeStats()
+        tree = AVLTree(stats=stats)
+        root = None
+        # the left child then its right child, a left right double rotation
+        for user in ("c", "a", "b"):
+            root = tree.insert(root, user, 1, 100)
+        self.assertEqual((stats.inserts, stats.insertDepthTotal, stats.maxInsertDepth), (3, 3, 2))
+        self.assertEqual((stats.rotations, stats.doubleRotations), (2, 1))
+
+        # names in order only ever need single rotations
+        for i in range(124):
+            root = tree.insert(root, f"d{i:03}", 1, 100)
+        self.assertEqual(stats.inserts, 127)
+        self.assertEqual(stats.doubleRotations, 1)
+        self.assertGreater(stats.rotations, 2)
+        self.assertEqual(checkAVL(root), 7)
+        self.assertLessEqual(stats.maxInsertDepth, 7)
+        self.assertEqual(stats.report()["averageInsertDepth"], stats.insertDepthTotal / 127)
+
+    def testScapeGoatCountsRebuilds(self):
+        stats = TreeStats()
+        tree = ScapeGoatTree(0.72, stats=stats)
+        for i in range(200):
+            tree.insert(f"u{i:03}", 1, 100)
+        self.assertEqual(stats.inserts, 200)
+        self.assertGreater(stats.rebuilds, 0)
+        self.assertLessEqual(stats.largestRebuild, 200)
+        self.assertGreaterEqual(stats.rebuiltNodes, stats.largestRebuild)
+        self.assertEqual(stats.report()["averageRebuild"], stats.rebuiltNodes / stats.rebuilds)
+        self.assertEqual((stats.rotations, stats.doubleRotations), (0, 0))
+
+    def testLookupsCountTheNodesReached(self):
+        bans = [(f"u{i % 40}", i % 5, 100 + i) for i in range(150)]
+        for aggregate in (False, True):
+            for makeTree in (lambda stats: AVLTree(aggregate, stats=stats),
+                             lambda stats: ScapeGoatTree(0.72, aggregate, stats=stats)):
+                stats = TreeStats()
+                tree, plain = makeTree(stats), makeTree(None)
+                root, plainRoot = tree.buildFromSorted(list(bans)), plain.buildFromSorted(list(bans))
+                if not isinstance(tree, AVLTree):
+                    root, plainRoot = tree.root, plain.root
+                size = root.subtreeSize
+
+                users = [f"u{i}" for i in range(45)]
+                for user in users:
+                    visited = stats.nodesVisited
+                    # the counted walk finds what the plain one does
+                    self.assertEqual(tree.getPlayer(root, user), plain.getPlayer(plainRoot, user))
+                    self.assertTrue(1 <= stats.nodesVisited - visited <= size)
+                self.assertEqual(stats.lookups, 45)
+
+                visited = stats.nodesVisited
+                self.assertEqual(tree.getPlayers(root, users + users), plain.getPlayers(plainRoot, users))
+                self.assertEqual(stats.lookups, 90)
+                # one walk for the batch reaches each node at most once
+                self.assertLessEqual(stats.nodesVisited - visited, size)
+
+
+class ResultCacheTest(unittest.TestCase):
+    def testLeastRecentlyUsedResultIsEvicted(self):
+        cache = ResultCache(2)
+        cache.put("a", (1, 100))
+        cache.put("b", (2, 200))
+        self.assertEqual(cache.get("a"), (1, 100))
+        # b is now the least recently used
+        cache.put("c", (3, 300))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), (1, 100))
+        self.assertEqual(cache.get("c"), (3, 300))
+        stats = cache.stats()
+        self.assertEqual((stats["cached"], stats["hits"], stats["misses"], stats["evictions"]), (2, 3, 1, 1))
+
+    def testResultGoesStaleAfterItsTimeToLive(self):
+        cache = ResultCache(10, timeToLive=0.05)
+        cache.put("a", (1, 100))
+        self.assertEqual(cache.get("a"), (1, 100))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["cached"], 0)
+
+    def testTreeChangesDropCachedResults(self):
+        bans = [("griefer", 1, 100), ("griefer", 2, 300), ("other", 1, 200)]
+        for aggregate in (False, True):
+            for tree in (AVLTree(aggregate, resultCache=ResultCache()),
+                         ScapeGoatTree(0.72, aggregate, resultCache=ResultCache())):
+                with self.subTest(tree=type(tree).__name__, aggregate=aggregate):
+                    isAVL = isinstance(tree, AVLTree)
+                    root = tree.buildFromSorted(list(bans))
+                    self.assertEqual(TreeRecords(tree, root).get("griefer"), [2, 300])
+                    self.assertEqual(TreeRecords(tree, root).get("griefer"), [2, 300])
+                    self.assertEqual(tree.resultCache.hits, 1)
+
+                    if isAVL:
+                        root = tree.insert(root, "griefer", 3, 400)
+                    else:
+                        tree.insert("griefer", 3, 400)
+                    self.assertEqual(TreeRecords(tree, root).get("griefer"), [3, 400])
+
+                    if isAVL:
+                        root, _ = tree.delete(root, "griefer", 3)
+                    else:
+                        tree.delete("griefer", 3)
+                    self.assertEqual(TreeRecords(tree, root).get("griefer"), [2, 300])
+
+                    self.assertEqual(TreeRecords(tree, root).get("other"), [1, 200])
+                    if isAVL:
+                        root, _ = tree.expireBefore(root, 250)
+                    else:
+                        tree.expireBefore(250)
+                    self.assertEqual(TreeRecords(tree, root).get("griefer"), [1, 300])
+                    self.assertIsNone(TreeRecords(tree, root).get("other"))
+
+
+class BloomFilterTest(unittest.TestCase):
+    def testAddedUsersAreAlwaysFound(self):
+        users = [f"banned{i}" for i in range(2000)]
+        banFilter = BloomFilter(len(users), 0.01)
+        for user in users + users[:10]:
+            banFilter.add(user)
+        self.assertTrue(all(user in banFilter for user in users))
+        stats = banFilter.stats()
+        self.assertEqual((stats["added"], stats["checks"], stats["rejected"]), (2010, 2000, 0))
+
+    def testUnbannedUsersAreRejectedOrCountedAsFalsePositives(self):
+        playerRecords = {f"banned{i}": [1, i] for i in range(2000)}
+        unbanned = [f"player{i}" for i in range(5000)]
+        bans = [(user, 1, record[1]) for user, record in playerRecords.items()]
+        avl = AVLTree(banFilter=BloomFilter(len(playerRecords), 0.01))
+        root = avl.buildFromSorted(bans)
+        scapeGoat = ScapeGoatTree(0.72, banFilter=BloomFilter(len(playerRecords), 0.01))
+        scapeGoat.buildFromSorted(bans)
+        filtered = FilteredRecords(playerRecords, BloomFilter(len(playerRecords), 0.01))
+        for user in playerRecords:
+            filtered.banFilter.add(user)
+
+        lookups = [(filtered.banFilter, lambda user: filtered.get(user)),
+                   (avl.banFilter, lambda user: avl.getPlayer(root, user)[0] or None),
+                   (scapeGoat.banFilter, lambda user: scapeGoat.getPlayer(scapeGoat.root, user)[0] or None)]
+        for banFilter, lookup in lookups:
+            self.assertTrue(all(lookup(user) is not None for user in playerRecords))
+            self.assertTrue(all(lookup(user) is None for user in unbanned))
+            stats = banFilter.stats()
+            self.assertEqual(stats["added"], 2000)
+            self.assertEqual(stats["checks"], 7000)
+            # every unbanned user is either rejected by the filter or found to be a false positive
+            self.assertEqual(stats["rejected"] + stats["falsePositives"], 5000)
+            self.assertEqual(stats["falsePositiveRate"], stats["falsePositives"] / 5000)
+            self.assertLess(stats["falsePositiveRate"], 0.05)
+
+        # a batch lookup counts the same way
+        avl.banFilter = BloomFilter(len(playerRecords), 0.01)
+        for user in playerRecords:
+            avl.banFilter.add(user)
+        results = avl.getPlayers(root, unbanned)
+        self.assertTrue(all(count == 0 for count, _ in results.values()))
+        stats = avl.banFilter.stats()
+        self.assertEqual(stats["checks"], 5000)
+        self.assertEqual(stats["rejected"] + stats["falsePositives"], 5000)
+
+
+class LiveIndexTest(unittest.TestCase):
+    def followAfter(self, backend, rows, saveIndex=False):
+        """
+        Load a .dat holding rows, append a ban after the load and before the LiveIndex
+        is made, then one more after
+        :return: the LiveIndex's answers for the first row's user and the two appended users
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            datPath = os.path.join(directory, "griefers.dat")
+            with open(datPath, "w") as file:
+                file.writelines(f"{user} {server} {time}\n" for user, server, time in rows)
+            if (saveIndex):
+                # the second load is answered from the snapshot the first one saved
+                loadIndex(backend, datPath, saveIndex=True)
+
+            bans = BanFileReader(datPath)
+            tree, root, playerRecords, datOffset = loadIndex(backend, datPath, saveIndex=saveIndex, bans=bans)
+            self.assertEqual(tree is None, saveIndex)
+            with open(datPath, "a") as file:
+                file.write("early 1 500\n")
+            liveIndex = LiveIndex(tree, root, playerRecords, bans, datOffset, pollInterval=0)
+            with open(datPath, "a") as file:
+                file.write("late 2 600\nearly 3 700\n")
+            return [liveIndex.get(user) for user in ("griefer", "early", "late")]
+
+    def testAppendedRowsAreTakenIn(self):
+        rows = [("griefer", 1, 100), ("griefer", 2, 300)]
+        for backend in ("avl", "scapegoat", "btree", "radix"):
+            with self.subTest(backend=backend):
+                self.assertEqual(self.followAfter(backend, rows), [[2, 300], [2, 700], [1, 600]])
+
+    def testRowsAppendedAfterASnapshotLoadAreTakenIn(self):
+        rows = [("griefer", 1, 100), ("griefer", 2, 300)]
+        self.assertEqual(self.followAfter("avl", rows, saveIndex=True), [[2, 300], [2, 700], [1, 600]])
+
+    def testEmptyFileIsFollowedFromTheStart(self):
+        for backend in ("avl", "scapegoat"):
+            with self.subTest(backend=backend):
+                self.assertEqual(self.followAfter(backend, []), [None, [2, 700], [1, 600]])
+
+
+class ParallelLoadTest(unittest.TestCase):
+    def testParallelFoldMatchesOneReader(self):
+        datPath = os.path.join(HERE, "sample_griefers.dat")
+        expected = recordsFromBans(BanFileReader(datPath))
+        for workers in (1, 2, 3, 7, 1000):
+            ranges = lineAlignedRanges(datPath, workers)
+            # the ranges run through the whole file without a gap or overlap
+            self.assertEqual([start for start, _ in ranges], [0] + [end for _, end in ranges[:-1]])
+            self.assertEqual(ranges[-1][1], os.path.getsize(datPath))
+            self.assertEqual(loadParallel(datPath, ranges), expected)
+
+        tree, root, playerRecords, datOffset = loadIndex("avl", datPath, workers=3)
+        self.assertIsNone(tree)
+        self.assertEqual(playerRecords, expected)
+        self.assertEqual(datOffset, os.path.getsize(datPath))
+
+
+class CommandLineTest(unittest.TestCase):
+    def testSampleOutputForEveryBackendAndFlag(self):
+        with open(os.path.join(HERE, "sample_input.txt"), "rb") as file:
+            sampleInput = file.read()
+        with open(os.path.join(HERE, "sample_output.txt")) as file:
+            # the last line is the time taken
+            expected = file.read().splitlines()[:-1]
+
+        flagSets = [[], ["--aggregate"], ["--bulk"], ["--aggregate", "--bulk"], ["--batch"], ["--bloom"],
+                    ["--stats"], ["--parallel"], ["--follow"], ["--progress"], ["--snapshot"], ["--cache", "4"],
+                    ["--cache", "64:60", "--bloom", "--batch"]]
+        for backend in ("avl", "scapegoat", "btree", "radix", "sorted"):
+            for flags in flagSets:
+                with self.subTest(backend=backend, flags=flags), tempfile.TemporaryDirectory() as directory:
+                    # a copy, so snapshots are written next to it and not in the repo
+                    datPath = shutil.copy(os.path.join(HERE, "sample_griefers.dat"), directory)
+                    command = [sys.executable, os.path.join(HERE, "main.py"), backend, datPath] + flags
+                    if (backend == "sorted" and "--follow" in flags):
+                        # the memory mapped records are read only, so they cannot be followed
+                        result = subprocess.run(command, input=sampleInput, capture_output=True)
+                        self.assertNotEqual(result.returncode, 0)
+                        self.assertEqual(len(result.stderr.decode().splitlines()), 1)
+                        continue
+                    # twice, so a --snapshot run also answers from the snapshot it saved
+                    for run in range(2 if "--snapshot" in flags else 1):
+                        result = subprocess.run(command, input=sampleInput, capture_output=True, check=True)
+                        self.assertEqual(result.stdout.decode().splitlines()[:-1], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
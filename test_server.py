@@ -0,0 +1,56 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from server import openListener, queryServer, serveConnections
+
+
+# Tests for server.py, run with python -m pytest or python -m unittest
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, "bans.sock")
+        playerRecords = {"cxmw@m!ka": [10, 1663715099]}
+        listener = openListener(self.address)
+        threading.Thread(target=serveConnections, args=(listener, playerRecords), daemon=True).start()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testManyNamesFromOneClient(self):
+        # more answers than the socket buffers hold, with the client still sending
+        answers = queryServer(self.address, ["cxmw@m!ka"] * 50000)
+        self.assertEqual(len(answers), 50000)
+        self.assertEqual(answers[0], "cxmw@m!ka was banned from 10 servers. most recently on: 1663715099")
+
+    def testClientThatNeverReads(self):
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(self.address)
+        stalled.setblocking(False)
+        try:
+            while True:
+                stalled.send(b"cxmw@m!ka\n" * 10000)
+        except BlockingIOError:
+            pass
+
+        # the other clients are still answered
+        self.assertEqual(queryServer(self.address, ["nobody"]),
+                         ["nobody is not currently banned from any servers."])
+        stalled.close()
+
+    def testInvalidUTF8(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.address)
+            client.sendall(b"\xff\xfe\n")
+            client.shutdown(socket.SHUT_WR)
+            self.assertTrue(client.recv(1 << 16).endswith(b"is not currently banned from any servers.\n"))
+        self.assertEqual(len(queryServer(self.address, ["cxmw@m!ka"])), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()